@@ -12,25 +12,33 @@ Long description of module's purpose
     'website': "https://www.yourcompany.com",
 
     'category': 'Customization',
-    'version': '0.1',
+    'version': '0.7',
 
     'depends': ['base',
                 'contacts',
                 'account',
                 'sale_management',
+                'currency_conversion_cache',
+                'cron_batch_runner',
     ],
 
     # always loaded
     'data': [
         'security/ir.model.access.csv',
+        'data/cashback_product_data.xml',
         'views/views.xml',
         'views/templates.xml',
+        'views/cashback_history.xml',
         'views/res_partner.xml',
         'views/res_config_settings.xml',
         'views/sale_order.xml',
+        'views/cashback_report.xml',
+        'views/account_move.xml',
+        'views/cashback_rule.xml',
 
         # crons
         'data/cashback_scheduled_actions.xml',
+        'data/cashback_server_actions.xml',
     ],
     'application': True,
     'installable': True,
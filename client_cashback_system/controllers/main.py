@@ -0,0 +1,99 @@
+from odoo import http
+from odoo.http import request
+from odoo.osv import expression
+from odoo.tools import SQL
+
+import hashlib
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Partners answered per request
+MAX_BALANCE_BATCH = 1000
+
+
+class CashbackBalanceController(http.Controller):
+
+    @http.route('/cashback/balances', type='http', auth='user', methods=['GET'], readonly=True)
+    def cashback_balances(self, ids='', refs='', **kwargs):
+        """Cashback figures of a batch of partners, by id and/or reference.
+
+        ``/cashback/balances?ids=7,8,9&refs=C001,C002``
+
+        Internal users only. Partners are resolved through the ORM search
+        query, so record rules apply. The ETag is built from the resolved
+        partners and their balance versions in one aggregate query, so clients
+        sending it back in If-None-Match get a 304 before any balance is read.
+        No Last-Modified is sent: a date cannot tell that a partner dropped out
+        of the result.
+        """
+        try:
+            partner_ids = [int(partner_id) for partner_id in ids.split(',') if partner_id.strip()]
+        except ValueError:
+            return self._json_response({'error': 'ids must be a comma separated list of integers'}, status=400)
+        partner_refs = [ref.strip() for ref in refs.split(',') if ref.strip()]
+        if len(partner_ids) + len(partner_refs) > MAX_BALANCE_BATCH:
+            return self._json_response({'error': f'at most {MAX_BALANCE_BATCH} partners per request'}, status=400)
+
+        env = request.env
+        if not env.user._is_internal():
+            return self._json_response({'error': 'only internal users may read cashback balances'}, status=403)
+
+        # Partner subquery with the access rights and record rules applied, nothing is read yet
+        domain = ['|', ('id', 'in', partner_ids), ('ref', 'in', partner_refs)] \
+            if partner_ids or partner_refs else expression.FALSE_DOMAIN
+        partner_query = env['res.partner'].with_context(active_test=False)._search(domain)
+
+        # The validator covers the resolved partners and their versions, so a
+        # partner leaving the result changes it too. Earns still pending count
+        # through their last id.
+        env.cr.execute(SQL("""
+            SELECT md5(string_agg(
+                       p.id || ':' || COALESCE(p.cashback_balance_version, 0) || ':' || COALESCE((
+                           SELECT MAX(q.id) FROM cashback_balance_pending q WHERE q.partner_id = p.id
+                       ), 0), ',' ORDER BY p.id))
+              FROM res_partner p
+             WHERE p.id IN %s
+        """, partner_query.subselect()))
+        versions = env.cr.fetchone()[0] or ''
+        etag = '"%s"' % hashlib.sha1(f'{ids}|{refs}|{versions}'.encode()).hexdigest()
+        headers = [('ETag', etag), ('Cache-Control', 'private, no-cache')]
+
+        if self._is_not_modified(etag):
+            return request.make_response('', headers=headers, status=304)
+
+        # Earned cashback not folded into the partner yet is part of the accumulated amount
+        env.cr.execute(SQL("""
+            SELECT p.id, p.ref, p.cashback_balans, COALESCE(p.accumulated_cashback, 0) + COALESCE(q.amount, 0),
+                   p.next_redeem_date, COALESCE(p.cashback_balance_version, 0)
+              FROM res_partner p
+              LEFT JOIN LATERAL (SELECT SUM(amount) AS amount
+                                   FROM cashback_balance_pending
+                                  WHERE partner_id = p.id) q ON TRUE
+             WHERE p.id IN %s
+             ORDER BY p.id
+        """, partner_query.subselect()))
+        rows = env.cr.fetchall()
+
+        return self._json_response({
+            'partners': [{
+                'id': partner_id,
+                'ref': ref or None,
+                'balance': balance or 0.0,
+                'accumulated': accumulated or 0.0,
+                'next_redeem_date': next_redeem_date and next_redeem_date.isoformat(),
+                'version': version,
+            } for partner_id, ref, balance, accumulated, next_redeem_date, version in rows],
+        }, headers=headers)
+
+    def _is_not_modified(self, etag):
+        if_none_match = request.httprequest.headers.get('If-None-Match')
+        return bool(if_none_match) and etag in [tag.strip() for tag in if_none_match.split(',')]
+
+    def _json_response(self, data, headers=None, status=200):
+        return request.make_response(
+            json.dumps(data),
+            headers=[('Content-Type', 'application/json')] + (headers or []),
+            status=status,
+        )
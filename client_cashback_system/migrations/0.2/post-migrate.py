@@ -0,0 +1,7 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Record existing partner balances as opening entries of the new ledger"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['cashback.ledger']._create_opening_entries()
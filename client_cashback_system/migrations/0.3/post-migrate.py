@@ -0,0 +1,20 @@
+from odoo.tools.sql import column_exists
+
+
+def migrate(cr, version):
+    """Keep only real per-contact percents as overrides of the global percent"""
+    if not column_exists(cr, 'res_partner', 'cashback_precent'):
+        return
+
+    cr.execute("SELECT value FROM ir_config_parameter WHERE key = 'cashback.precent'")
+    row = cr.fetchone()
+    global_percent = int(row[0] or 0) if row else 0
+
+    # An explicit 0 turns cashback off for the contact: it stays an override
+    cr.execute("""
+        UPDATE res_partner
+           SET cashback_precent_custom = TRUE,
+               cashback_precent_override = cashback_precent
+         WHERE cashback_precent IS NOT NULL AND cashback_precent != %s
+    """, [global_percent])
+    cr.execute("ALTER TABLE res_partner DROP COLUMN cashback_precent")
@@ -0,0 +1,15 @@
+def migrate(cr, version):
+    """Fill the stored redemption dates from the existing redemption history"""
+    cr.execute("SELECT value FROM ir_config_parameter WHERE key = 'cashback.redeem_days'")
+    row = cr.fetchone()
+    redeem_days = int(row[0]) if row and row[0] else 90
+
+    cr.execute("""
+        UPDATE res_partner p
+           SET last_redemption_date = r.last_date,
+               next_redeem_date = r.last_date + %s
+          FROM (SELECT partner_id, MAX(redemption_date) AS last_date
+                  FROM cashback_redemption
+                 GROUP BY partner_id) r
+         WHERE r.partner_id = p.id
+    """, [redeem_days])
@@ -0,0 +1,11 @@
+def migrate(cr, version):
+    """Flag the redemption lines created before lines were marked explicitly"""
+    cr.execute("""
+        UPDATE sale_order_line l
+           SET is_cashback_line = TRUE
+          FROM ir_model_data d
+         WHERE d.module = 'client_cashback_system'
+           AND d.name = 'product_cashback'
+           AND l.product_id = d.res_id
+           AND l.price_unit < 0
+    """)
@@ -0,0 +1,19 @@
+def migrate(cr, version):
+    """Adopt the existing "Cashback" product instead of creating a second one"""
+    cr.execute("""
+        SELECT pp.id
+          FROM product_product pp
+          JOIN product_template pt ON pt.id = pp.product_tmpl_id
+         WHERE pt.name->>'en_US' = 'Cashback'
+           AND pt.type = 'service'
+         ORDER BY pp.id
+         LIMIT 1
+    """)
+    row = cr.fetchone()
+    if not row:
+        return
+    cr.execute("""
+        INSERT INTO ir_model_data (module, name, model, res_id, noupdate)
+        VALUES ('client_cashback_system', 'product_cashback', 'product.product', %s, TRUE)
+        ON CONFLICT DO NOTHING
+    """, [row[0]])
@@ -0,0 +1,7 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Fill the partner summary counters from the existing ledger"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['cashback.ledger']._rebuild_partner_counters()
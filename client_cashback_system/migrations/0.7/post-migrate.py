@@ -0,0 +1,7 @@
+from odoo.tools.sql import drop_index
+
+
+def migrate(cr, version):
+    """Drop plain indexes already covered by the partial and composite ones"""
+    drop_index(cr, 'res_partner__cashback_precent_custom_index', 'res_partner')
+    drop_index(cr, 'cashback_redemption__partner_id_index', 'cashback_redemption')
@@ -6,4 +6,12 @@ from . import account_move
 from . import cashback_transaction
 from . import cashback_redemption_wizard
 from . import sale_order
-from . import cashback_redemption
\ No newline at end of file
+from . import cashback_redemption
+from . import cashback_ledger
+from . import cashback_notification
+from . import cashback_report
+from . import cashback_transaction_archive
+from . import cashback_settlement_slice
+from . import cashback_award_queue
+from . import cashback_rule
+from . import cashback_balance_pending
\ No newline at end of file
@@ -1,125 +1,261 @@
 from odoo import models, fields, api
-from odoo.exceptions import ValidationError
+from odoo.exceptions import UserError, ValidationError
+from .cashback_perf import cashback_perf
 
+from collections import defaultdict
 from datetime import datetime
-from markupsafe import Markup
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Posted invoices awarded (and committed) per chunk of the backfill
+BACKFILL_BATCH_SIZE = 1000
+
 class AccountMove(models.Model):
     _inherit = 'account.move'
 
+    cashback_award_state = fields.Selection(
+        [
+            ('pending', 'Cashback Pending'),
+            ('failed', 'Cashback Failed'),
+        ],
+        string='Cashback Award',
+        compute='_compute_cashback_award_state',
+    )
+
+    def _compute_cashback_award_state(self):
+        states = dict(self.env['cashback.award.queue'].sudo()._read_group(
+            [('move_id', 'in', self.ids)],
+            ['move_id'],
+            ['state:max'],
+        ))
+        for move in self:
+            move.cashback_award_state = states.get(move, False)
+
     def action_post(self):
         """Post invoice and process cashback"""
         result = super().action_post()
 
-        # Processing cashback after invoice is posted
-        for move in self:
-            if move.move_type in ['out_invoice', 'out_refund']:
-                move._process_cashback_on_invoice()
+        invoices = self.filtered(lambda m: m.move_type in ['out_invoice', 'out_refund'])
+        settings = self.env['res.config.settings']._get_cashback_settings()
+        if settings.enabled and settings.award_mode == 'async':
+            # Posting only queues the award, the runner computes it in the background
+            self.env['cashback.award.queue'].sudo()._enqueue(
+                invoices.filtered(lambda m: m.move_type == 'out_invoice' and m.partner_id)
+            )
+        else:
+            # Processing cashback for the whole batch after invoices are posted
+            invoices._process_cashback_on_invoice()
 
         return result
 
+    @cashback_perf('invoice_award')
     def _process_cashback_on_invoice(self):
-        """Process cashback for customer invoices"""
-        for move in self:
-            if move.move_type == 'out_refund':
-                continue
+        """Process cashback for customer invoices in one set-based pass"""
+        # Checking if cashback is enabled (once for the whole batch)
+        if not self.env['res.config.settings']._get_cashback_settings().enabled:
+            return
 
-            if not move.partner_id:
-                continue
+        moves = self.filtered(lambda m: m.move_type == 'out_invoice' and m.partner_id)
+        # Re-posted invoices keep the cashback they already earned
+        moves -= moves._get_cashback_awarded_moves()
+        if not moves:
+            return
+
+        # Summing up only products with positive price per move and product
+        # category, for all moves in one grouped query
+        category_totals = defaultdict(lambda: defaultdict(float))
+        for move, product, total in self.env['account.move.line']._read_group(
+            [('move_id', 'in', moves.ids), ('price_unit', '>', 0)],
+            ['move_id', 'product_id'],
+            ['price_subtotal:sum'],
+        ):
+            category_totals[move.id][product.categ_id.id] += total
+
+        # Effective cashback percent of all partners resolved at once
+        percents = moves.partner_id.commercial_partner_id._get_cashback_percents()
+        # First matching cashback rule of every (move, category), from the compiled rules
+        rules = self.env['cashback.rule']._match_rules(
+            moves, {move_id: list(totals) for move_id, totals in category_totals.items()}
+        )
 
+        awards = []
+        for move in moves:
             partner = move.partner_id.commercial_partner_id
 
-            # Checking if cashback is enabled
-            cashback_enabled = self.env['ir.config_parameter'].sudo().get_param('cashback.enabled')
-            if cashback_enabled != 'True':
-                continue
+            # A percent set on the partner itself wins over the rules
+            partner_percent = percents[partner.id] or 0
+            use_rules = not partner.cashback_precent_custom
+
+            # Calculating cashback amount in invoice currency, category by category
+            base_amount = cashback_amount = 0.0
+            rule_ids = set()
+            for categ_id, total in category_totals.get(move.id, {}).items():
+                rule = use_rules and rules.get((move.id, categ_id))
+                if rule:
+                    rule_ids.add(rule.id)
+                cashback_amount += total * ((rule.percent if rule else partner_percent) / 100)
+                base_amount += total
+            _logger.debug('Positive price total for %s: %f', move.name, base_amount)
 
-            # Partner's cashback percent
-            cashback_precent = partner.cashback_precent or 0
-            if cashback_precent <= 0:
+            # Negative quantities can cancel the base out entirely
+            if cashback_amount <= 0 or base_amount <= 0:
                 continue
 
-            # Summing up only products with positive price
-            positive_price_total = sum(
-                line.price_subtotal for line in move.line_ids if line.price_unit > 0
-            )
-            _logger.info('Positive price total: %f', positive_price_total)
-
-
-            # Company currency
-            company_currency = move.company_id.currency_id
-
-            # Calculating cashback amount in invoice currency
-            cashback_amount_invoice_currency = positive_price_total * (cashback_precent / 100)
-
-            # Converting to company currency if needed
-            if move.currency_id != company_currency:
-                cashback_amount = move.currency_id._convert(
-                    cashback_amount_invoice_currency,
-                    company_currency,
-                    move.company_id,
-                    move.date
-                )
-            else:
-                cashback_amount = cashback_amount_invoice_currency
-
-            # Creating cashback transaction and write to chatter
-            self._create_cashback_transaction(
-                move,
-                partner,
-                cashback_amount,
-                company_currency,
-                cashback_precent
-            )
+            awards.append({
+                'move': move,
+                'partner': partner,
+                'amount': cashback_amount,
+                'currency': move.company_id.currency_id,
+                # Effective percent over the whole invoice
+                'percent': round(cashback_amount / base_amount * 100, 2),
+                'rule_ids': sorted(rule_ids),
+            })
 
-    def _create_cashback_transaction(self, move, partner, cashback_amount, currency, percent):
-        """Create cashback transaction and log to partner chatter"""
-
-        odoo_bot = self.env.ref('base.partner_root')
-
-
-        partner.accumulated_cashback += cashback_amount
-
-        message = Markup(f"""
-                <strong>Cashback Transaction</strong><br/>
-                <ul>
-                    <li><strong>Invoice:</strong> {move.name}</li>
-                    <li><strong>Invoice Date:</strong> {move.date.strftime('%Y-%m-%d')}</li>
-                    <li><strong>Invoice Amount:</strong> {move.amount_total:,.2f} {move.currency_id.name}</li>
-                    <li><strong>Cashback Percent:</strong> {percent}%</li>
-                    <li><strong>Cashback Amount:</strong> {cashback_amount:,.2f} {currency.name}</li>
-                    <li><strong>Total Accumulated Cashback:</strong> {partner.accumulated_cashback:,.2f} {currency.name}</li>
-                    <li><strong>Current Cashback Balance:</strong> {partner.cashback_balans:,.2f} {currency.name}</li>
-                </ul>
-                """)
-
-        partner.message_post(
-            body=message,
-            subject='Cashback Earned',
-            message_type='comment',
-            subtype_xmlid='mail.mt_comment',
-            author_id=odoo_bot.id,
-        )
+        # Converting to company currency, one vector conversion per (currency, company, date)
+        to_convert = defaultdict(list)
+        for award in awards:
+            move = award['move']
+            if move.currency_id != award['currency']:
+                to_convert[(move.currency_id, award['currency'], move.company_id, move.date)].append(award)
+        for (currency, company_currency, company, date), group in to_convert.items():
+            amounts = currency._convert_amounts([award['amount'] for award in group], company_currency, company, date)
+            for award, amount in zip(group, amounts):
+                award['amount'] = amount
 
-        move.message_post(
-            body=f"Cashback of {cashback_amount:,.2f} {currency.name} ({percent}%) awarded to {partner.name}",
-            subject='Cashback Processed',
-            message_type='comment',
-            subtype_xmlid='mail.mt_comment',
-            author_id=odoo_bot.id,
-        )
+        if awards:
+            self._create_cashback_transactions(awards)
+
+    def _get_cashback_awarded_moves(self):
+        """Return the moves that already earned cashback.
+
+        Awards go through the unique earn index of the ledger, but invoices
+        awarded before the ledger existed only left a (possibly archived)
+        cashback transaction behind.
+        """
+        if not self:
+            return self.browse()
+        self.env['cashback.ledger'].flush_model(['invoice_id', 'entry_type'])
+        self.env['cashback.transaction'].flush_model(['invoice_id'])
+        self.env.cr.execute("""
+            SELECT invoice_id FROM cashback_ledger WHERE entry_type = 'earn' AND invoice_id = ANY(%(ids)s)
+             UNION
+            SELECT invoice_id FROM cashback_transaction WHERE invoice_id = ANY(%(ids)s)
+             UNION
+            SELECT invoice_id FROM cashback_transaction_archive WHERE invoice_id = ANY(%(ids)s)
+        """, {'ids': self.ids})
+        return self.browse(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def action_start_cashback_backfill(self):
+        """Award cashback to all posted invoices that never earned it, in the background"""
+        if not self.env['res.config.settings']._get_cashback_settings().enabled:
+            raise UserError('Enable cashback in the settings before running the backfill.')
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('cashback.backfill_running', True)
+        ICP.set_param('cashback.backfill_last_move_id', 0)
+        self.env.ref('client_cashback_system.ir_cron_cashback_backfill')._trigger()
+
+    @api.model
+    def _cron_backfill_cashback(self):
+        """Walk posted customer invoices in id order and award the missing cashback.
+
+        The last processed invoice is committed with every chunk, so the job
+        resumes where it stopped and never holds locks for long.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        if not ICP.get_param('cashback.backfill_running'):
+            return
+        last_move_id = int(ICP.get_param('cashback.backfill_last_move_id', 0))
+
+        def award_batch():
+            nonlocal last_move_id
+            moves = self.search([
+                ('id', '>', last_move_id),
+                ('move_type', '=', 'out_invoice'),
+                ('state', '=', 'posted'),
+            ], order='id', limit=BACKFILL_BATCH_SIZE)
+            if not moves:
+                ICP.set_param('cashback.backfill_running', False)
+                ICP.set_param('cashback.backfill_last_move_id', False)
+                _logger.info('Cashback backfill finished')
+                return 0
+
+            # Historical invoices get no chatter message each
+            moves.with_context(cashback_backfill=True)._process_cashback_on_invoice()
+
+            last_move_id = moves[-1].id
+            ICP.set_param('cashback.backfill_last_move_id', last_move_id)
+            _logger.info('Cashback backfill: processed %d invoices up to id %d', len(moves), last_move_id)
+            return len(moves)
+
+        self.env['ir.cron']._run_batches(award_batch, self.env.ref('client_cashback_system.ir_cron_cashback_backfill'))
+
+    def _create_cashback_transactions(self, awards):
+        """Create cashback transactions for a batch of awards and log to chatter"""
+        # Earns not folded into the partner row yet are part of the accumulated amount
+        partners = self.env['res.partner'].concat(*(award['partner'] for award in awards))
+        pending = dict(self.env['cashback.balance.pending'].sudo()._read_group(
+            [('partner_id', 'in', partners.ids)],
+            ['partner_id'],
+            ['amount:sum'],
+        ))
+        running_totals = {
+            partner: partner.accumulated_cashback + pending.get(partner, 0.0)
+            for partner in partners
+        }
+
+        events = []
+        for award in awards:
+            move, partner = award['move'], award['partner']
+            cashback_amount, currency, percent = award['amount'], award['currency'], award['percent']
+            running_totals[partner] += cashback_amount
+
+            events.append((partner, 'earned', {
+                'reference': move.name,
+                'invoice_date': move.date.strftime('%Y-%m-%d'),
+                'invoice_amount': move.amount_total,
+                'invoice_currency': move.currency_id.name,
+                'percent': percent,
+                'amount': cashback_amount,
+                'currency': currency.name,
+                'accumulated': running_totals[partner],
+                'balance': partner.cashback_balans,
+            }))
+            events.append((move, 'processed', {
+                'reference': move.name,
+                'partner_id': partner.id,
+                'partner_name': partner.name,
+                'percent': percent,
+                'amount': cashback_amount,
+                'currency': currency.name,
+            }))
+
+        # Chatter is posted now or queued, depending on the notification mode
+        if not self.env.context.get('cashback_backfill'):
+            self.env['cashback.notification']._notify(events)
+
+        # Creating all cashback records for tracking in one multi-row create
+        transactions = self.env['cashback.transaction'].create([{
+            'partner_id': award['partner'].id,
+            'invoice_id': award['move'].id,
+            'cashback_percent': award['percent'],
+            'invoice_amount': award['move'].amount_total,
+            'invoice_currency_id': award['move'].currency_id.id,
+            'cashback_amount': award['amount'],
+            'cashback_currency_id': award['currency'].id,
+            'transaction_date': award['move'].date,
+            'rule_ids': [(6, 0, award['rule_ids'])],
+        } for award in awards])
 
-        # Creating cashback record for tracking
-        self.env['cashback.transaction'].create({
-            'partner_id': partner.id,
-            'invoice_id': move.id,
-            'cashback_percent': percent,
-            'invoice_amount': move.amount_total,
-            'invoice_currency_id': move.currency_id.id,
-            'cashback_amount': cashback_amount,
-            'cashback_currency_id': currency.id,
-            'transaction_date': move.date
-        })
\ No newline at end of file
+        # Posting earn entries to the ledger, which increments each partner once
+        self.env['cashback.ledger'].create([{
+            'partner_id': award['partner'].id,
+            'company_id': award['move'].company_id.id,
+            'currency_id': award['currency'].id,
+            'entry_type': 'earn',
+            'amount': award['amount'],
+            'date': award['move'].date,
+            'transaction_id': transaction.id,
+            'invoice_id': award['move'].id,
+        } for award, transaction in zip(awards, transactions)])
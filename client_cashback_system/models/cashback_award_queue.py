@@ -0,0 +1,109 @@
+from odoo import models, fields, api
+
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Queued invoices awarded (and committed) per chunk of the runner
+AWARD_BATCH_SIZE = 500
+# Failed attempts after which an invoice is left for manual handling
+AWARD_MAX_ATTEMPTS = 5
+
+
+class CashbackAwardQueue(models.Model):
+    """Posted invoices waiting for their cashback award in the background"""
+    _name = 'cashback.award.queue'
+    _description = 'Cashback Award Queue'
+    _order = 'id'
+
+    move_id = fields.Many2one('account.move', string='Invoice', required=True, index=True, ondelete='cascade', readonly=True)
+    state = fields.Selection(
+        [
+            ('pending', 'Pending'),
+            ('failed', 'Failed'), # Gave up after AWARD_MAX_ATTEMPTS, see last_error
+        ],
+        string='Status',
+        default='pending',
+        required=True,
+        index=True,
+        readonly=True,
+    )
+    attempts = fields.Integer(string='Attempts', readonly=True)
+    next_attempt = fields.Datetime(string='Next Attempt', readonly=True)
+    last_error = fields.Text(string='Last Error', readonly=True)
+
+    _sql_constraints = [
+        ('move_uniq', 'unique(move_id)', 'An invoice can only be queued once for cashback!'),
+    ]
+
+    @api.model
+    def _enqueue(self, moves):
+        """Queue the invoices for the runner, ignoring those already queued"""
+        queued = self.search([('move_id', 'in', moves.ids)]).move_id
+        self.create([{'move_id': move.id} for move in moves - queued])
+        self.env.ref('client_cashback_system.ir_cron_cashback_award_queue')._trigger()
+
+    @api.model
+    def _claim(self, limit):
+        """Lock a batch of due entries for the current transaction, skipping those other runners hold"""
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT id
+              FROM cashback_award_queue
+             WHERE state = 'pending'
+               AND (next_attempt IS NULL OR next_attempt <= NOW() AT TIME ZONE 'UTC')
+             ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [limit])
+        return self.browse(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def _cron_process_queue(self):
+        """Award cashback to queued invoices in committed batches"""
+        def award_batch():
+            entries = self._claim(AWARD_BATCH_SIZE)
+            entries._process()
+            return len(entries)
+
+        self.env['ir.cron']._run_batches(award_batch, self.env.ref('client_cashback_system.ir_cron_cashback_award_queue'))
+
+    def _process(self):
+        """Award the whole batch at once; on failure, retry entry by entry to isolate the bad ones"""
+        try:
+            with self.env.cr.savepoint():
+                self._award()
+            _logger.info('Awarded queued cashback of %d invoices', len(self))
+            return
+        except Exception:
+            _logger.warning('Queued cashback batch failed, retrying %d invoices one by one', len(self), exc_info=True)
+
+        for entry in self:
+            try:
+                with self.env.cr.savepoint():
+                    entry._award()
+            except Exception as e:
+                entry._mark_failed(e)
+
+    def _award(self):
+        moves = self.move_id.filtered(lambda m: m.state == 'posted')
+        moves._process_cashback_on_invoice()
+        self.unlink()
+
+    def _mark_failed(self, error):
+        attempts = self.attempts + 1
+        if attempts >= AWARD_MAX_ATTEMPTS:
+            _logger.error('Giving up cashback award of %s after %d attempts: %s', self.move_id.name, attempts, error)
+        self.write({
+            'attempts': attempts,
+            'state': 'failed' if attempts >= AWARD_MAX_ATTEMPTS else 'pending',
+            # Backing off 2, 4, 8... minutes between attempts
+            'next_attempt': fields.Datetime.now() + timedelta(minutes=2 ** attempts),
+            'last_error': str(error),
+        })
+
+    def action_retry(self):
+        """Put failed entries back in the queue"""
+        self.write({'state': 'pending', 'attempts': 0, 'next_attempt': False})
+        self.env.ref('client_cashback_system.ir_cron_cashback_award_queue')._trigger()
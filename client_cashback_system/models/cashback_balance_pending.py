@@ -0,0 +1,38 @@
+from odoo import models, fields, api
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Customers folded (and committed) per chunk of the folding cron
+FOLD_BATCH_SIZE = 1000
+
+
+class CashbackBalancePending(models.Model):
+    """Earned cashback not yet added to the customer's balance.
+
+    Earns only insert here, so concurrent invoices of the same customer never
+    update (or wait on) its res_partner row. The increments are folded into
+    the partner balances by the next balance change of the customer, or by
+    the folding cron when the customer was busy.
+    """
+    _name = 'cashback.balance.pending'
+    _description = 'Pending Cashback Increment'
+    _order = 'id'
+    _log_access = False
+
+    partner_id = fields.Many2one('res.partner', string='Customer', required=True, index=True, ondelete='cascade')
+    amount = fields.Float(string='Amount', required=True)
+    date = fields.Date(string='Date', required=True)
+
+    @api.model
+    def _cron_fold(self):
+        """Fold the increments left behind by busy customers, in committed chunks"""
+        def fold_batch():
+            partners = self.search([], limit=FOLD_BATCH_SIZE).partner_id
+            folded = partners._cashback_fold_pending(nowait=True)
+            if folded:
+                _logger.info('Folded pending cashback of %d customers', len(folded))
+            return len(folded)
+
+        self.env['ir.cron']._run_batches(fold_batch, self.env.ref('client_cashback_system.ir_cron_cashback_fold_pending'))
@@ -0,0 +1,272 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+from collections import defaultdict
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# (accumulated sign, balance sign) applied to the entry amount per entry type
+LEDGER_ENTRY_DELTAS = {
+    'earn': (1, 0),      # Invoice awarded cashback to accumulated
+    'settle': (-1, 1),   # Month-end transfer from accumulated to balance
+    'reset': (-1, 0),    # Month-end forfeit of accumulated because of debt
+    'redeem': (0, -1),   # Balance spent on a sales order
+    'refund': (0, 1),    # Redemption given back when the order is cancelled
+}
+
+# (earned, redeemed, reset) sign of the partner's lifetime counters per entry type
+LEDGER_LIFETIME_COUNTERS = {
+    'earn': (1, 0, 0),
+    'settle': (0, 0, 0),   # Moves accumulated to balance, counted when earned
+    'reset': (0, 0, 1),
+    'redeem': (0, 1, 0),
+    'refund': (0, -1, 0),  # Cancelled redemptions are not counted as redeemed
+}
+
+
+class CashbackLedger(models.Model):
+    """Append-only ledger of every cashback movement"""
+    _name = 'cashback.ledger'
+    _description = 'Cashback Ledger Entry'
+    _order = 'date desc, id desc'
+
+    def init(self):
+        # Partner history, newest first
+        create_index(self.env.cr, 'cashback_ledger_partner_date_idx', self._table, ['partner_id', 'date DESC', 'id DESC'])
+
+        # An invoice earns cashback at most once, even when re-posted or backfilled
+        self.env.cr.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT invoice_id
+                  FROM cashback_ledger
+                 WHERE entry_type = 'earn' AND invoice_id IS NOT NULL
+                 GROUP BY invoice_id
+                HAVING COUNT(*) > 1
+            ) duplicates
+        """)
+        duplicates = self.env.cr.fetchone()[0]
+        if duplicates:
+            _logger.error('%d invoices earned cashback more than once, the unique award index '
+                          'cashback_ledger_earn_invoice_uniq was not created', duplicates)
+        else:
+            create_index(self.env.cr, 'cashback_ledger_earn_invoice_uniq', self._table,
+                         ['invoice_id'], unique=True, where="entry_type = 'earn' AND invoice_id IS NOT NULL")
+
+    partner_id = fields.Many2one('res.partner', string='Customer', required=True, index=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', string='Company', default=lambda self: self.env.company)
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Currency',
+        default=lambda self: self.env.company.currency_id
+    )
+
+    entry_type = fields.Selection(
+        [
+            ('opening', 'Opening Balance'), # Balances that existed before the ledger
+            ('earn', 'Earned'),
+            ('settle', 'Settled'),
+            ('reset', 'Reset'),
+            ('redeem', 'Redeemed'),
+            ('refund', 'Cancel Refund'),
+        ],
+        string='Type',
+        required=True,
+        readonly=True,
+    )
+    date = fields.Date(string='Date', required=True, readonly=True, default=fields.Date.today)
+    amount = fields.Monetary(string='Amount', readonly=True)
+    accumulated_delta = fields.Monetary(string='Accumulated Change', readonly=True)
+    balance_delta = fields.Monetary(string='Balance Change', readonly=True)
+
+    transaction_id = fields.Many2one('cashback.transaction', string='Transaction', readonly=True, ondelete='set null')
+    redemption_id = fields.Many2one('cashback.redemption', string='Redemption', readonly=True, ondelete='set null')
+    invoice_id = fields.Many2one('account.move', string='Invoice', readonly=True, ondelete='set null')
+    sale_order_id = fields.Many2one('sale.order', string='Sales Order', readonly=True, ondelete='set null', index='btree_not_null')
+    notes = fields.Text(string='Notes', readonly=True)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals['entry_type'] == 'opening':
+                continue
+            accumulated_sign, balance_sign = LEDGER_ENTRY_DELTAS[vals['entry_type']]
+            vals['accumulated_delta'] = accumulated_sign * vals.get('amount', 0.0)
+            vals['balance_delta'] = balance_sign * vals.get('amount', 0.0)
+
+        entries = super().create(vals_list)
+        # Opening entries only record balances that are already materialized
+        entries.filtered(lambda e: e.entry_type != 'opening')._apply_to_partner_balances()
+        return entries
+
+    def write(self, vals):
+        raise UserError('Cashback ledger entries cannot be modified, post a new entry instead.')
+
+    def unlink(self):
+        raise UserError('Cashback ledger entries cannot be deleted, post a new entry instead.')
+
+    def _apply_to_partner_balances(self):
+        """Increment the materialized partner balances and counters, once per partner"""
+        deltas = defaultdict(lambda: [0.0, 0.0])
+        activity = defaultdict(lambda: [0.0, 0.0, 0.0, None])
+        pending = []
+        for entry in self:
+            partner_id = entry.partner_id.id
+            if entry.entry_type == 'earn':
+                # Earns are only queued: invoices of a customer never wait on its row
+                pending.append({'partner_id': partner_id, 'amount': entry.amount, 'date': entry.date})
+                continue
+            deltas[partner_id][0] += entry.accumulated_delta
+            deltas[partner_id][1] += entry.balance_delta
+
+            counters = activity[partner_id]
+            for index, sign in enumerate(LEDGER_LIFETIME_COUNTERS[entry.entry_type]):
+                counters[index] += sign * entry.amount
+            counters[3] = max(counters[3] or entry.date, entry.date)
+
+        if pending:
+            self.env['cashback.balance.pending'].sudo().create(pending)
+            # Folded right away unless a concurrent transaction has the customer
+            self.env['res.partner'].browse({vals['partner_id'] for vals in pending})._cashback_fold_pending(nowait=True)
+        self.env['res.partner']._cashback_apply_deltas(deltas, activity)
+
+    @api.model
+    def _create_opening_entries(self):
+        """Record existing partner balances that have no ledger history yet"""
+        self.env['res.partner'].flush_model(['accumulated_cashback', 'cashback_balans'])
+        self.env.cr.execute("""
+            SELECT p.id, p.company_id, COALESCE(p.accumulated_cashback, 0), COALESCE(p.cashback_balans, 0)
+              FROM res_partner p
+             WHERE (COALESCE(p.accumulated_cashback, 0) != 0 OR COALESCE(p.cashback_balans, 0) != 0)
+               AND NOT EXISTS (SELECT 1 FROM cashback_ledger l WHERE l.partner_id = p.id)
+        """)
+        rows = self.env.cr.fetchall()
+        companies = self.env['res.company'].browse({row[1] for row in rows if row[1]})
+        currencies = {company.id: company.currency_id.id for company in companies}
+        self.create([{
+            'partner_id': partner_id,
+            'company_id': company_id or self.env.company.id,
+            'currency_id': currencies.get(company_id) or self.env.company.currency_id.id,
+            'entry_type': 'opening',
+            'amount': accumulated + balance,
+            'accumulated_delta': accumulated,
+            'balance_delta': balance,
+            'notes': 'Opening balance recorded when the cashback ledger was introduced',
+        } for partner_id, company_id, accumulated, balance in rows])
+        _logger.info('Created %d cashback opening ledger entries', len(rows))
+
+    @api.model
+    def _rebuild_partner_balances(self, partner_ids=None, repair=True):
+        """Recompute partner balances from the ledger.
+
+        Returns the list of ``(partner_id, stored accumulated, ledger accumulated,
+        stored balance, ledger balance)`` rows that did not match. With
+        ``repair`` the mismatching partners are corrected in the same statement.
+        """
+        self.env['res.partner'].flush_model(['accumulated_cashback', 'cashback_balans'])
+        self.env['cashback.balance.pending'].flush_model()
+        self.flush_model()
+
+        # Earned cashback still pending counts as part of the stored accumulated amount
+        partner_filter = 'AND p.id IN %(partner_ids)s' if partner_ids else ''
+        self.env.cr.execute(f"""
+            WITH totals AS (
+                SELECT partner_id,
+                       SUM(accumulated_delta) AS accumulated,
+                       SUM(balance_delta) AS balance
+                  FROM cashback_ledger
+                 GROUP BY partner_id
+            ), pending AS (
+                SELECT partner_id, SUM(amount) AS amount
+                  FROM cashback_balance_pending
+                 GROUP BY partner_id
+            )
+            SELECT p.id,
+                   COALESCE(p.accumulated_cashback, 0) + COALESCE(q.amount, 0), COALESCE(t.accumulated, 0),
+                   COALESCE(p.cashback_balans, 0), COALESCE(t.balance, 0),
+                   COALESCE(q.amount, 0)
+              FROM res_partner p
+              LEFT JOIN totals t ON t.partner_id = p.id
+              LEFT JOIN pending q ON q.partner_id = p.id
+             WHERE (ROUND((COALESCE(p.accumulated_cashback, 0) + COALESCE(q.amount, 0))::numeric, 2) != ROUND(COALESCE(t.accumulated, 0)::numeric, 2)
+                OR ROUND(COALESCE(p.cashback_balans, 0)::numeric, 2) != ROUND(COALESCE(t.balance, 0)::numeric, 2))
+                   {partner_filter}
+        """, {'partner_ids': tuple(partner_ids or ())})
+        rows = self.env.cr.fetchall()
+        mismatches = [row[:5] for row in rows]
+
+        if mismatches and repair:
+            self.env.cr.execute("""
+                UPDATE res_partner p
+                   SET accumulated_cashback = v.accumulated,
+                       cashback_balans = v.balance,
+                       cashback_balance_version = COALESCE(p.cashback_balance_version, 0) + 1,
+                       cashback_balance_write_date = NOW() AT TIME ZONE 'UTC'
+                  FROM (SELECT unnest(%s) AS id, unnest(%s) AS accumulated, unnest(%s) AS balance) v
+                 WHERE p.id = v.id
+            """, [
+                [row[0] for row in rows],
+                [row[2] - row[5] for row in rows],
+                [row[4] for row in rows],
+            ])
+            self.env['res.partner'].invalidate_model([
+                'accumulated_cashback', 'cashback_balans', 'cashback_balance_version', 'cashback_balance_write_date',
+            ])
+            _logger.warning('Repaired cashback balances of %d partners from the ledger', len(mismatches))
+
+        if repair:
+            self._rebuild_partner_counters(partner_ids)
+
+        return mismatches
+
+    @api.model
+    def _rebuild_partner_counters(self, partner_ids=None):
+        """Recompute the partners' lifetime counters and last activity date from the ledger"""
+        self.env['res.partner'].flush_model([
+            'cashback_lifetime_earned', 'cashback_lifetime_redeemed',
+            'cashback_lifetime_reset', 'cashback_last_activity_date',
+        ])
+        self.env['cashback.balance.pending'].flush_model()
+        self.flush_model()
+
+        # Pending earned cashback is added to the counters when it is folded
+        partner_filter = 'AND p.id IN %(partner_ids)s' if partner_ids else ''
+        self.env.cr.execute(f"""
+            WITH ledger AS (
+                SELECT partner_id,
+                       SUM(amount) FILTER (WHERE entry_type = 'earn') AS earned,
+                       SUM(CASE entry_type WHEN 'redeem' THEN amount WHEN 'refund' THEN -amount END) AS redeemed,
+                       SUM(amount) FILTER (WHERE entry_type = 'reset') AS reset,
+                       MAX(date) FILTER (WHERE entry_type != 'opening') AS last_date
+                  FROM cashback_ledger
+                 GROUP BY partner_id
+            ), pending AS (
+                SELECT partner_id, SUM(amount) AS amount
+                  FROM cashback_balance_pending
+                 GROUP BY partner_id
+            ), totals AS (
+                SELECT l.partner_id, COALESCE(l.earned, 0) - COALESCE(q.amount, 0) AS earned,
+                       l.redeemed, l.reset, l.last_date
+                  FROM ledger l
+                  LEFT JOIN pending q ON q.partner_id = l.partner_id
+            )
+            UPDATE res_partner p
+               SET cashback_lifetime_earned = COALESCE(t.earned, 0),
+                   cashback_lifetime_redeemed = COALESCE(t.redeemed, 0),
+                   cashback_lifetime_reset = COALESCE(t.reset, 0),
+                   cashback_last_activity_date = t.last_date
+              FROM totals t
+             WHERE t.partner_id = p.id
+               AND (ROUND(COALESCE(p.cashback_lifetime_earned, 0)::numeric, 2) != ROUND(COALESCE(t.earned, 0)::numeric, 2)
+                OR ROUND(COALESCE(p.cashback_lifetime_redeemed, 0)::numeric, 2) != ROUND(COALESCE(t.redeemed, 0)::numeric, 2)
+                OR ROUND(COALESCE(p.cashback_lifetime_reset, 0)::numeric, 2) != ROUND(COALESCE(t.reset, 0)::numeric, 2)
+                OR p.cashback_last_activity_date IS DISTINCT FROM t.last_date)
+                   {partner_filter}
+        """, {'partner_ids': tuple(partner_ids or ())})
+        if self.env.cr.rowcount:
+            self.env['res.partner'].invalidate_model([
+                'cashback_lifetime_earned', 'cashback_lifetime_redeemed',
+                'cashback_lifetime_reset', 'cashback_last_activity_date',
+            ])
+            _logger.info('Recomputed cashback counters of %d partners from the ledger', self.env.cr.rowcount)
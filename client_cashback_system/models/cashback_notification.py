@@ -0,0 +1,141 @@
+from odoo import models, fields, api
+from .cashback_perf import cashback_perf
+
+from collections import defaultdict
+from datetime import datetime, time as dt_time
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Event type -> (QWeb template, chatter subject)
+NOTIFICATION_EVENTS = {
+    'earned': ('client_cashback_system.cashback_message_earned', 'Cashback Earned'),
+    'processed': ('client_cashback_system.cashback_message_processed', 'Cashback Processed'),
+    'settled': ('client_cashback_system.cashback_message_settled', '✓ Monthly Cashback Settlement - Completed'),
+    'reset': ('client_cashback_system.cashback_message_reset', '⏳ Monthly Cashback Settlement - Reset'),
+    'redeemed': ('client_cashback_system.cashback_message_redeemed', 'Cashback Redeemed'),
+    'refunded': ('client_cashback_system.cashback_message_refunded', 'Cashback Refunded - Order Cancelled'),
+}
+
+# Outbox rows posted (and committed) per chunk of the flush cron
+FLUSH_BATCH_SIZE = 1000
+
+
+def format_amount(amount, currency_name):
+    return f'{amount or 0.0:,.2f} {currency_name or ""}'.strip()
+
+
+class CashbackNotification(models.Model):
+    """Outbox of cashback chatter messages waiting to be posted"""
+    _name = 'cashback.notification'
+    _description = 'Cashback Notification'
+    _order = 'id'
+
+    res_model = fields.Char(string='Document Model', required=True)
+    res_id = fields.Many2oneReference(string='Document', model_field='res_model', required=True)
+    partner_id = fields.Many2one('res.partner', string='Customer', index=True, ondelete='cascade')
+    event_type = fields.Selection(
+        [
+            ('earned', 'Earned'),
+            ('processed', 'Invoice Processed'),
+            ('settled', 'Settled'),
+            ('reset', 'Reset'),
+            ('redeemed', 'Redeemed'),
+            ('refunded', 'Refunded'),
+        ],
+        string='Event',
+        required=True,
+    )
+    values = fields.Json(string='Values')
+
+    @api.model
+    def _notify(self, events):
+        """Post cashback events now, or queue them in the outbox.
+
+        ``events`` is a list of ``(record, event_type, values)`` where values is
+        a JSON-serializable dict used to render the event's template.
+        """
+        if not events:
+            return
+        mode = self.env['res.config.settings']._get_cashback_settings().notification_mode
+        if mode == 'immediate':
+            for record, event_type, values in events:
+                self._post_event(record, event_type, values)
+            return
+
+        self.sudo().create([{
+            'res_model': record._name,
+            'res_id': record.id,
+            'partner_id': record.id if record._name == 'res.partner' else values.get('partner_id'),
+            'event_type': event_type,
+            'values': values,
+        } for record, event_type, values in events])
+
+    @api.model
+    def _render_event(self, event_type, values):
+        """Render an event with its (compiled and cached) QWeb template"""
+        template = NOTIFICATION_EVENTS[event_type][0]
+        return self.env['ir.qweb']._render(template, dict(values, format_amount=format_amount))
+
+    @api.model
+    def _post_event(self, record, event_type, values):
+        self._post_message(record, NOTIFICATION_EVENTS[event_type][1], self._render_event(event_type, values))
+
+    @api.model
+    def _post_message(self, record, subject, body):
+        odoo_bot = self.env.ref('base.partner_root')
+        record.message_post(
+            body=body,
+            subject=subject,
+            message_type='comment',
+            subtype_xmlid='mail.mt_comment',
+            author_id=odoo_bot.id,
+        )
+
+    @api.model
+    def _cron_flush_notifications(self):
+        """Post queued cashback messages in committed chunks"""
+        mode = self.env['res.config.settings']._get_cashback_settings().notification_mode
+        domain = []
+        if mode == 'digest':
+            # Partner events are summarized once a day, after the day is over
+            today_start = datetime.combine(fields.Date.context_today(self), dt_time.min)
+            domain = ['|', ('res_model', '!=', 'res.partner'), ('create_date', '<', today_start)]
+
+        def flush_batch():
+            notifications = self.search(domain, limit=FLUSH_BATCH_SIZE)
+            if notifications:
+                notifications._flush(digest=mode == 'digest')
+                _logger.info('Flushed %d cashback notifications', len(notifications))
+            return len(notifications)
+
+        self.env['ir.cron']._run_batches(
+            flush_batch, self.env.ref('client_cashback_system.ir_cron_cashback_flush_notifications')
+        )
+
+    @cashback_perf('notification_flush')
+    def _flush(self, digest=False):
+        """Post the queued messages and remove them from the outbox"""
+        by_partner = defaultdict(list)
+        for notification in self:
+            record = self.env[notification.res_model].browse(notification.res_id).exists()
+            if not record:
+                continue
+            if digest and notification.res_model == 'res.partner':
+                by_partner[record].append(notification)
+            else:
+                self._post_event(record, notification.event_type, notification.values)
+
+        # One summary message per partner instead of one per event
+        for partner, notifications in by_partner.items():
+            events = [
+                dict(n.values, subject=NOTIFICATION_EVENTS[n.event_type][1], date=n.create_date.strftime('%Y-%m-%d'))
+                for n in notifications
+            ]
+            body = self.env['ir.qweb']._render(
+                'client_cashback_system.cashback_message_digest',
+                {'events': events, 'format_amount': format_amount},
+            )
+            self._post_message(partner, 'Cashback Summary', body)
+
+        self.unlink()
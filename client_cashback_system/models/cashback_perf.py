@@ -0,0 +1,49 @@
+from odoo.tools import config
+
+from datetime import datetime
+import functools
+import json
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+def cashback_perf(operation):
+    """Measure the queries and wall-clock time of a cashback batch operation.
+
+    Enabled by the ``cashback_perf_log`` server option: every call then
+    appends one JSON line to that file, with the batch size and the queries
+    per record, so growing per-record costs show up before month end.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            path = config.get('cashback_perf_log')
+            if not path:
+                return method(self, *args, **kwargs)
+
+            cr = self.env.cr
+            queries_before = cr.sql_log_count
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                size = len(self) or 1
+                queries = cr.sql_log_count - queries_before
+                record = {
+                    'operation': operation,
+                    'timestamp': datetime.now().isoformat(timespec='seconds'),
+                    'size': size,
+                    'queries': queries,
+                    'queries_per_record': round(queries / size, 2),
+                    'seconds': round(time.perf_counter() - start, 4),
+                }
+                _logger.info('Cashback perf %s', record)
+                try:
+                    with open(path, 'a') as log_file:
+                        log_file.write(json.dumps(record) + '\n')
+                except OSError:
+                    _logger.warning('Could not write cashback perf log to %s', path, exc_info=True)
+        return wrapper
+    return decorator
@@ -1,4 +1,5 @@
 from odoo import models, fields, api
+from odoo.tools.sql import create_index
 
 
 class CashbackRedemption(models.Model):
@@ -7,6 +8,10 @@ class CashbackRedemption(models.Model):
     _description = 'Cashback Redemption'
     _order = 'redemption_date desc'
 
+    def init(self):
+        # Partner history, newest first, and every other lookup by partner
+        create_index(self.env.cr, 'cashback_redemption_partner_date_idx', self._table, ['partner_id', 'redemption_date DESC'])
+
     partner_id = fields.Many2one(
         'res.partner',
         string='Customer',
@@ -33,5 +38,50 @@ class CashbackRedemption(models.Model):
         default=fields.Date.today
     )
 
+    state = fields.Selection(
+        [
+            ('redeemed', 'Redeemed'),
+            ('reversed', 'Reversed'), # Given back because the order was cancelled
+        ],
+        string='Status',
+        default='redeemed',
+        readonly=True,
+    )
+
+    refunded_amount = fields.Float(
+        string='Refunded Amount',
+        readonly=True,
+    )
+
+    reversal_date = fields.Date(
+        string='Reversal Date',
+        readonly=True,
+    )
+
+    ledger_ids = fields.One2many(
+        'cashback.ledger',
+        'redemption_id',
+        string='Ledger Entries',
+        readonly=True
+    )
+
     notes = fields.Text(string='Notes')
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        redemptions = super().create(vals_list)
+        redemptions.partner_id._update_redemption_dates()
+        return redemptions
+
+    def write(self, vals):
+        partners = self.partner_id
+        result = super().write(vals)
+        if 'redemption_date' in vals or 'partner_id' in vals:
+            (partners | self.partner_id)._update_redemption_dates()
+        return result
+
+    def unlink(self):
+        partners = self.partner_id
+        result = super().unlink()
+        partners._update_redemption_dates()
+        return result
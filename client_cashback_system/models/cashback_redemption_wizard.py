@@ -1,8 +1,8 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
+from .cashback_perf import cashback_perf
 
-from datetime import datetime, timedelta
-from markupsafe import Markup
+from datetime import datetime
 
 import logging
 
@@ -26,22 +26,23 @@ class CashbackRedemptionWizard(models.TransientModel):
         readonly=True
     )
 
+    # All state below is computed together by _compute_wizard_state
     cashback_balance = fields.Float(
         string='Available Cashback Balance',
         readonly=True,
-        compute='_compute_cashback_balance'
+        compute='_compute_wizard_state'
     )
 
     order_total = fields.Float(
         string='Current Order Total',
         readonly=True,
-        compute='_compute_order_total'
+        compute='_compute_wizard_state'
     )
 
     max_redeemable = fields.Float(
         string='Maximum Redeemable',
         readonly=True,
-        compute='_compute_max_redeemable',
+        compute='_compute_wizard_state',
         help='Minimum of order total and cashback balance'
     )
 
@@ -54,20 +55,20 @@ class CashbackRedemptionWizard(models.TransientModel):
     last_redemption_date = fields.Date(
         string='Last Redemption Date',
         readonly=True,
-        compute='_compute_last_redemption'
+        compute='_compute_wizard_state'
     )
 
     can_redeem = fields.Boolean(
         string='Can Redeem',
         readonly=True,
-        compute='_compute_can_redeem',
+        compute='_compute_wizard_state',
         help='Can redeem every 3 months'
     )
 
     redemption_info = fields.Html(
         string='Redemption Info',
         readonly=True,
-        compute='_compute_redemption_info'
+        compute='_compute_wizard_state'
     )
 
     currency_id = fields.Many2one(
@@ -77,114 +78,84 @@ class CashbackRedemptionWizard(models.TransientModel):
     )
 
     @api.depends('sale_order_id')
-    def _compute_cashback_balance(self):
-        """Get partner's cashback balance"""
-        for wizard in self:
-            wizard.cashback_balance = wizard.partner_id.cashback_balans or 0.0
-
-    @api.depends('sale_order_id')
-    def _compute_order_total(self):
-        """Get current order total"""
+    def _compute_wizard_state(self):
+        """Build the whole wizard state in one pass from the stored partner data"""
+        redeem_days = self.env['res.config.settings']._get_cashback_settings().redeem_days
+        today = fields.Date.today()
         for wizard in self:
+            partner = wizard.partner_id
+            wizard.cashback_balance = partner.cashback_balans or 0.0
             wizard.order_total = wizard.sale_order_id.amount_total or 0.0
-
-    @api.depends('cashback_balance', 'order_total')
-    def _compute_max_redeemable(self):
-        """Calculate maximum redeemable amount"""
-        for wizard in self:
             wizard.max_redeemable = min(wizard.cashback_balance, wizard.order_total)
+            wizard.last_redemption_date = partner.last_redemption_date
+            wizard.can_redeem = not partner.next_redeem_date or partner.next_redeem_date <= today
+            wizard.redemption_info = wizard._get_redemption_info(redeem_days, today)
 
-    @api.depends('partner_id')
-    def _compute_last_redemption(self):
-        """Get last redemption date"""
-        for wizard in self:
-            last_redemption = self.env['cashback.redemption'].search(
-                [('partner_id', '=', wizard.partner_id.id)],
-                order='redemption_date desc',
-                limit=1
-            )
-            wizard.last_redemption_date = last_redemption.redemption_date if last_redemption else None
-
-
-
-    @api.depends('last_redemption_date')
-    def _compute_can_redeem(self):
-        """Check if partner can redeem based on configured days"""
-        redeem_days = int(self.env['ir.config_parameter'].sudo().get_param('cashback.redeem_days', default='90'))
-        for wizard in self:
-            if not wizard.last_redemption_date:
-                wizard.can_redeem = True
-            else:
-                days_since_last = (fields.Date.today() - wizard.last_redemption_date).days
-                wizard.can_redeem = days_since_last >= redeem_days
-
-    @api.depends('cashback_balance', 'last_redemption_date', 'can_redeem', 'order_total')
-    def _compute_redemption_info(self):
+    def _get_redemption_info(self, redeem_days, today):
         """Prepare information message"""
-        for wizard in self:
-            currency = (
-                    wizard.partner_id.company_id.currency_id
-                    or wizard.sale_order_id.company_id.currency_id
-                    or self.env.company.currency_id
-            )
+        self.ensure_one()
+        currency = (
+                self.partner_id.company_id.currency_id
+                or self.sale_order_id.company_id.currency_id
+                or self.env.company.currency_id
+        )
 
-            info = f"""
-                <div style="padding: 15px; background-color: #f0f0f0; border-radius: 5px;">
-                    <h4>Cashback Redemption Information</h4>
-                    <table style="width: 100%; margin-top: 10px;">
-                        <tr>
-                            <td><strong>Available Cashback Balance:</strong></td>
-                            <td>{wizard.cashback_balance:,.2f} {currency.name}</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Current Order Total:</strong></td>
-                            <td>{wizard.order_total:,.2f} {currency.name}</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Maximum You Can Redeem:</strong></td>
-                            <td style="color: green; font-weight: bold;">{wizard.max_redeemable:,.2f} {currency.name}</td>
-                        </tr>
+        info = f"""
+            <div style="padding: 15px; background-color: #f0f0f0; border-radius: 5px;">
+                <h4>Cashback Redemption Information</h4>
+                <table style="width: 100%; margin-top: 10px;">
+                    <tr>
+                        <td><strong>Available Cashback Balance:</strong></td>
+                        <td>{self.cashback_balance:,.2f} {currency.name}</td>
+                    </tr>
+                    <tr>
+                        <td><strong>Current Order Total:</strong></td>
+                        <td>{self.order_total:,.2f} {currency.name}</td>
+                    </tr>
+                    <tr>
+                        <td><strong>Maximum You Can Redeem:</strong></td>
+                        <td style="color: green; font-weight: bold;">{self.max_redeemable:,.2f} {currency.name}</td>
+                    </tr>
+            """
+
+        if self.last_redemption_date:
+            days_since = (today - self.last_redemption_date).days
+            next_redemption = self.partner_id.next_redeem_date
+
+            info += f"""
+                    <tr>
+                        <td><strong>Last Redemption:</strong></td>
+                        <td>{self.last_redemption_date.strftime('%Y-%m-%d')}</td>
+                    </tr>
+                    <tr>
+                        <td><strong>Days Since Last Redemption:</strong></td>
+                        <td>{days_since} days</td>
+                    </tr>
+                    <tr>
+                        <td><strong>Next Available Redemption:</strong></td>
+                        <td>{next_redemption.strftime('%Y-%m-%d')}</td>
+                    </tr>
                 """
 
-            redeem_days = int(self.env['ir.config_parameter'].sudo().get_param('cashback.redeem_days', default='90'))
-            if wizard.last_redemption_date:
-                days_since = (fields.Date.today() - wizard.last_redemption_date).days
-                next_redemption = wizard.last_redemption_date + timedelta(days=redeem_days)
-
-                info += f"""
-                        <tr>
-                            <td><strong>Last Redemption:</strong></td>
-                            <td>{wizard.last_redemption_date.strftime('%Y-%m-%d')}</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Days Since Last Redemption:</strong></td>
-                            <td>{days_since} days</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Next Available Redemption:</strong></td>
-                            <td>{next_redemption.strftime('%Y-%m-%d')}</td>
-                        </tr>
-                    """
-
-            if not wizard.can_redeem:
-                info += f"""
-                        <tr style="background-color: #ffe0e0;">
-                            <td colspan="2"><strong style="color: red;">❌ You can only redeem cashback every {redeem_days} days</strong></td>
-                        </tr>
-                    """
-            else:
-                info += """
-                        <tr style="background-color: #e0ffe0;">
-                            <td colspan="2"><strong style="color: green;">✓ You can redeem cashback now</strong></td>
-                        </tr>
-                    """
-
+        if not self.can_redeem:
+            info += f"""
+                    <tr style="background-color: #ffe0e0;">
+                        <td colspan="2"><strong style="color: red;">❌ You can only redeem cashback every {redeem_days} days</strong></td>
+                    </tr>
+                """
+        else:
             info += """
-                    </table>
-                </div>
+                    <tr style="background-color: #e0ffe0;">
+                        <td colspan="2"><strong style="color: green;">✓ You can redeem cashback now</strong></td>
+                    </tr>
                 """
 
-            wizard.redemption_info = info
+        info += """
+                </table>
+            </div>
+            """
+
+        return info
 
     @api.onchange('redemption_amount')
     def _onchange_redemption_amount(self):
@@ -197,13 +168,16 @@ class CashbackRedemptionWizard(models.TransientModel):
                 f'Redemption amount cannot exceed {self.max_redeemable:,.2f}'
             )
 
+    @cashback_perf('redeem')
     def action_redeem_cashback(self):
         """Apply cashback discount to sales order"""
         self.ensure_one()
 
-        odoo_bot = self.env.ref('base.partner_root')
+        # Only one redemption per partner at a time, decided on its current
+        # balance; the balance guard in the ledger refuses any overdraw
+        self.partner_id._cashback_lock()
 
-        redeem_days = self.env['ir.config_parameter'].sudo().get_param('cashback.redeem_days', default='90')
+        redeem_days = self.env['res.config.settings']._get_cashback_settings().redeem_days
 
         # Validate redemption eligibility
         if not self.can_redeem:
@@ -219,7 +193,7 @@ class CashbackRedemptionWizard(models.TransientModel):
             raise ValidationError('Redemption amount cannot exceed order total')
 
         # Creating cashback product line
-        product = self._get_or_create_cashback_product()
+        product = self._get_cashback_product()
 
         # Add line to sales order
         line_vals = {
@@ -228,13 +202,13 @@ class CashbackRedemptionWizard(models.TransientModel):
             'product_uom_qty': 1,
             'price_unit': -self.redemption_amount,  # Negative price
             'name': f'Cashback Redemption - {self.redemption_amount:,.2f}',
+            'is_cashback_line': True,
         }
 
         sale_line = self.env['sale.order.line'].create(line_vals)
 
-        self.partner_id.cashback_balans -= self.redemption_amount
         # Creating redemption history
-        self.env['cashback.redemption'].create({
+        redemption = self.env['cashback.redemption'].create({
             'partner_id': self.partner_id.id,
             'redemption_amount': self.redemption_amount,
             'redemption_date': fields.Date.today(),
@@ -242,43 +216,31 @@ class CashbackRedemptionWizard(models.TransientModel):
         })
         _logger.info("Cashback redemption history created...")
 
+        # Deducting the balance through the ledger
+        self.env['cashback.ledger'].create({
+            'partner_id': self.partner_id.id,
+            'company_id': self.sale_order_id.company_id.id,
+            'currency_id': self.sale_order_id.company_id.currency_id.id,
+            'entry_type': 'redeem',
+            'amount': self.redemption_amount,
+            'redemption_id': redemption.id,
+            'sale_order_id': self.sale_order_id.id,
+        })
+
         currency = self.sale_order_id.currency_id
         _logger.info(f"Partner ID: {self.partner_id.id}, Currency: {currency.name}")
 
-        message = Markup(f"""
-                <strong>Cashback Redeemed</strong><br/>
-                <ul>
-                    <li><strong>Redemption Amount:</strong> {self.redemption_amount:,.2f} {currency.name}</li>
-                    <li><strong>Applied to Sales Order:</strong> <a href="/web#id={self.sale_order_id.id}&model=sale.order">{self.sale_order_id.name}</a></li>
-                    <li><strong>New Cashback Balance:</strong> {self.partner_id.cashback_balans:,.2f} {currency.name}</li>
-                    <li><strong>Redemption Date:</strong> {fields.Date.today().strftime('%Y-%m-%d')}</li>
-                </ul>
-                """)
-
-        self.partner_id.message_post(
-            body=message,
-            subject='Cashback Redeemed',
-            message_type='comment',
-            subtype_xmlid='mail.mt_comment',
-            author_id = odoo_bot.id,
-        )
+        self.env['cashback.notification']._notify([(self.partner_id, 'redeemed', {
+            'amount': self.redemption_amount,
+            'currency': currency.name,
+            'order_id': self.sale_order_id.id,
+            'reference': self.sale_order_id.name,
+            'balance': self.partner_id.cashback_balans,
+            'date': fields.Date.today().strftime('%Y-%m-%d'),
+        })])
 
         return {'type': 'ir.actions.act_window_close'}
 
-    def _get_or_create_cashback_product(self):
-        """Get or create cashback discount product"""
-        product = self.env['product.product'].search([
-            ('name', '=', 'Cashback'),
-            ('type', '=', 'service')
-        ], limit=1)
-
-        if not product:
-            product = self.env['product.product'].create({
-                'name': 'Cashback',
-                'type': 'service',
-                'list_price': 0,
-                'categ_id': self.env.ref('product.product_category_all').id,
-            })
-
-        return product
-
+    def _get_cashback_product(self):
+        """Get cashback discount product (xmlid lookups are cached by the registry)"""
+        return self.env.ref('client_cashback_system.product_cashback')
@@ -0,0 +1,63 @@
+from odoo import models, fields, api
+from odoo.tools import sql
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CashbackReport(models.Model):
+    """Monthly cashback totals per partner and company, pre-aggregated from the ledger"""
+    _name = 'cashback.report'
+    _description = 'Cashback Analysis'
+    _auto = False
+    _rec_name = 'partner_id'
+    _order = 'date desc'
+
+    partner_id = fields.Many2one('res.partner', string='Customer', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Currency', readonly=True)
+    date = fields.Date(string='Month', readonly=True)
+
+    earned_amount = fields.Monetary(string='Earned', readonly=True)
+    settled_amount = fields.Monetary(string='Settled', readonly=True)
+    reset_amount = fields.Monetary(string='Reset', readonly=True)
+    redeemed_amount = fields.Monetary(string='Redeemed', readonly=True)
+    refunded_amount = fields.Monetary(string='Cancel Refunds', readonly=True)
+    entry_count = fields.Integer(string='# Entries', readonly=True)
+
+    def _query(self):
+        # MIN(id) of the ledger rows is unique per group and never changes,
+        # the ledger being append-only
+        return """
+            SELECT MIN(l.id) AS id,
+                   l.partner_id,
+                   l.company_id,
+                   l.currency_id,
+                   date_trunc('month', l.date)::date AS date,
+                   SUM(CASE WHEN l.entry_type = 'earn' THEN l.amount ELSE 0 END) AS earned_amount,
+                   SUM(CASE WHEN l.entry_type = 'settle' THEN l.amount ELSE 0 END) AS settled_amount,
+                   SUM(CASE WHEN l.entry_type = 'reset' THEN l.amount ELSE 0 END) AS reset_amount,
+                   SUM(CASE WHEN l.entry_type = 'redeem' THEN l.amount ELSE 0 END) AS redeemed_amount,
+                   SUM(CASE WHEN l.entry_type = 'refund' THEN l.amount ELSE 0 END) AS refunded_amount,
+                   COUNT(*) AS entry_count
+              FROM cashback_ledger l
+             WHERE l.entry_type != 'opening'
+             GROUP BY l.partner_id, l.company_id, l.currency_id, date_trunc('month', l.date)
+        """
+
+    def init(self):
+        # Materialized, so reports never scan the ledger; refreshed by cron
+        sql.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"CREATE MATERIALIZED VIEW {self._table} AS ({self._query()})")
+        # Required for REFRESH ... CONCURRENTLY
+        self.env.cr.execute(f"CREATE UNIQUE INDEX {self._table}_id_idx ON {self._table} (id)")
+        self.env.cr.execute(f"CREATE INDEX {self._table}_partner_date_idx ON {self._table} (partner_id, date)")
+
+    @api.model
+    def _cron_refresh(self):
+        """Refresh the report without blocking readers"""
+        self.env['cashback.ledger'].flush_model()
+        self.env.cr.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self._table}")
+        self.invalidate_model()
+        _logger.info('Cashback report refreshed')
@@ -0,0 +1,130 @@
+from odoo import models, fields, api, tools
+from odoo.exceptions import ValidationError
+
+from collections import namedtuple
+
+# Immutable form of an active rule, kept in the registry cache
+CompiledRule = namedtuple('CompiledRule', [
+    'id', 'company_id', 'categ_id', 'partner_category_id', 'min_amount', 'date_from', 'date_to', 'percent',
+])
+
+
+class CashbackRule(models.Model):
+    """Cashback rate for a product category, customer tier, invoice size or campaign period"""
+    _name = 'cashback.rule'
+    _description = 'Cashback Rule'
+    _order = 'sequence, id'
+
+    name = fields.Char(string='Name', required=True)
+    active = fields.Boolean(default=True)
+    sequence = fields.Integer(string='Sequence', default=10, help='The first matching rule applies')
+    company_id = fields.Many2one('res.company', string='Company')
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Currency',
+        compute='_compute_currency_id',
+    )
+
+    percent = fields.Float(string='Cashback Percent', required=True)
+
+    # Conditions, all optional
+    product_categ_id = fields.Many2one(
+        'product.category',
+        string='Product Category',
+        help='Applies to products of this category and its subcategories'
+    )
+    partner_category_id = fields.Many2one(
+        'res.partner.category',
+        string='Customer Tier',
+        help='Applies to customers with this tag'
+    )
+    min_invoice_amount = fields.Monetary(
+        string='Minimum Invoice Amount',
+        help='Untaxed invoice total in company currency'
+    )
+    date_from = fields.Date(string='Campaign Start')
+    date_to = fields.Date(string='Campaign End')
+
+    @api.depends('company_id')
+    def _compute_currency_id(self):
+        for rule in self:
+            rule.currency_id = (rule.company_id or self.env.company).currency_id
+
+    @api.constrains('percent', 'date_from', 'date_to')
+    def _check_rule(self):
+        for rule in self:
+            if rule.percent < 0:
+                raise ValidationError('Cashback percent cannot be negative')
+            if rule.date_from and rule.date_to and rule.date_from > rule.date_to:
+                raise ValidationError('The campaign cannot end before it starts')
+
+    @api.model
+    def _get_compiled_rules(self):
+        """Return the active rules in evaluation order, compiled once per version of the rules.
+
+        The version is the set of visible rule row versions, so any change to
+        the rules gives a new cache entry without clearing the registry cache,
+        and uncommitted rules of one transaction never leak into another.
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT md5(string_agg(id || ':' || xmin::text, ',' ORDER BY id))
+              FROM cashback_rule
+        """)
+        return self._compile_rules(self.env.cr.fetchone()[0])
+
+    @api.model
+    @tools.ormcache('version')
+    def _compile_rules(self, version):
+        return tuple(
+            CompiledRule(
+                id=rule.id,
+                company_id=rule.company_id.id,
+                categ_id=rule.product_categ_id.id,
+                partner_category_id=rule.partner_category_id.id,
+                min_amount=rule.min_invoice_amount,
+                date_from=rule.date_from,
+                date_to=rule.date_to,
+                percent=rule.percent,
+            )
+            for rule in self.sudo().search([])
+        )
+
+    @api.model
+    def _match_rules(self, moves, categ_ids_by_move):
+        """Return ``{(move_id, categ_id): compiled rule}`` for the first rule matching each pair.
+
+        Conditions of a move (company, customer tier, size, date) are checked once
+        per move, only the category is checked per product category.
+        """
+        compiled = self._get_compiled_rules()
+        if not compiled:
+            return {}
+
+        # Categories are matched on their parent path, which stays current when
+        # the category tree changes
+        categ_ids = {categ_id for move_categ_ids in categ_ids_by_move.values() for categ_id in move_categ_ids if categ_id}
+        ancestors = {
+            categ.id: {int(parent_id) for parent_id in categ.parent_path.split('/') if parent_id}
+            for categ in self.env['product.category'].sudo().browse(categ_ids)
+        }
+
+        matches = {}
+        for move in moves:
+            tag_ids = set(move.partner_id.commercial_partner_id.category_id.ids)
+            candidates = [
+                rule for rule in compiled
+                if (not rule.company_id or rule.company_id == move.company_id.id)
+                and (not rule.partner_category_id or rule.partner_category_id in tag_ids)
+                and (not rule.min_amount or move.amount_untaxed_signed >= rule.min_amount)
+                and (not rule.date_from or move.date >= rule.date_from)
+                and (not rule.date_to or move.date <= rule.date_to)
+            ]
+            if not candidates:
+                continue
+            for categ_id in categ_ids_by_move.get(move.id, ()):
+                for rule in candidates:
+                    if not rule.categ_id or rule.categ_id in ancestors.get(categ_id, ()):
+                        matches[(move.id, categ_id)] = rule
+                        break
+        return matches
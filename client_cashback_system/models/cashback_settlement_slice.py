@@ -0,0 +1,132 @@
+from odoo import models, fields, api
+from odoo.addons.cron_batch_runner.models.ir_cron import BATCH_TIME_LIMIT
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Worker crons settling slices in parallel, see cashback_scheduled_actions.xml
+SETTLEMENT_WORKER_CRONS = [
+    'client_cashback_system.ir_cron_cashback_settlement_worker_1',
+    'client_cashback_system.ir_cron_cashback_settlement_worker_2',
+    'client_cashback_system.ir_cron_cashback_settlement_worker_3',
+    'client_cashback_system.ir_cron_cashback_settlement_worker_4',
+]
+
+
+class CashbackSettlementSlice(models.Model):
+    """Partner id range of a month-end settlement, claimed by one worker at a time"""
+    _name = 'cashback.settlement.slice'
+    _description = 'Cashback Settlement Slice'
+    _order = 'period desc, id_from'
+
+    period = fields.Date(string='Period', required=True, index=True, readonly=True)
+    id_from = fields.Integer(string='From Partner ID', required=True, readonly=True)
+    # Empty on the last slice, which also covers partners created after planning
+    id_to = fields.Integer(string='To Partner ID', readonly=True)
+    state = fields.Selection(
+        [
+            ('pending', 'Pending'),
+            ('done', 'Done'),
+        ],
+        string='Status',
+        default='pending',
+        required=True,
+        readonly=True,
+    )
+    partner_count = fields.Integer(string='Settled Partners', readonly=True)
+    date_done = fields.Datetime(string='Done On', readonly=True)
+
+    @api.model
+    def _plan_period(self, period_start, slice_size, start_id=0):
+        """Split the partners with accumulated cashback into id ranges of ``slice_size`` partners"""
+        Partner = self.env['res.partner']
+        Partner.flush_model(['accumulated_cashback'])
+        self.env.cr.execute("""
+            SELECT id FROM res_partner WHERE accumulated_cashback > 0 AND id > %s ORDER BY id
+        """, [start_id])
+        partner_ids = [row[0] for row in self.env.cr.fetchall()]
+
+        bounds = [start_id + 1] + partner_ids[slice_size::slice_size]
+        slices = self.create([{
+            'period': period_start,
+            'id_from': id_from,
+            'id_to': bounds[index + 1] - 1 if index + 1 < len(bounds) else False,
+        } for index, id_from in enumerate(bounds)])
+        _logger.info('Cashback settlement for period %s planned in %d slices', period_start, len(slices))
+        return slices
+
+    @api.model
+    def _is_period_done(self, period_start):
+        return not self.search_count([('period', '=', period_start), ('state', '=', 'pending')])
+
+    @api.model
+    def _get_worker_crons(self):
+        return self.env['ir.cron'].union(*(self.env.ref(xmlid) for xmlid in SETTLEMENT_WORKER_CRONS))
+
+    @api.model
+    def _trigger_workers(self):
+        for cron in self._get_worker_crons():
+            cron._trigger()
+
+    @api.model
+    def _claim(self, period_start):
+        """Lock one pending slice for the current transaction, skipping those other workers hold"""
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT id
+              FROM cashback_settlement_slice
+             WHERE period = %s AND state = 'pending'
+             ORDER BY id_from
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """, [period_start])
+        row = self.env.cr.fetchone()
+        return self.browse(row[0] if row else ())
+
+    @api.model
+    def _cron_settle_slices(self):
+        """Settle pending slices of the current period until none is left or time is up.
+
+        Each slice is claimed, settled and marked done in a single transaction:
+        a crashed worker leaves its slice pending for the next one, and a slice
+        held by a worker is never seen by the others.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        period = ICP.get_param('cashback.settlement_period')
+        if not period:
+            return
+        period_start = fields.Date.from_string(period)
+        time_limit = int(ICP.get_param('cashback.settlement_time_limit', BATCH_TIME_LIMIT))
+
+        Partner = self.env['res.partner']
+        Pending = self.env['cashback.balance.pending']
+
+        def settle_slice():
+            settlement_slice = self._claim(period_start)
+            if not settlement_slice:
+                # Letting the coordinator close the period right away
+                self.env.ref('client_cashback_system.ir_cron_cashback_settlement_check')._trigger()
+                return 0
+
+            id_domain = [('id', '>=', settlement_slice.id_from)]
+            if settlement_slice.id_to:
+                id_domain.append(('id', '<=', settlement_slice.id_to))
+            # Locking the slice's customers right after the claim keeps concurrent
+            # folds out; customers with only pending earnings are folded first
+            candidates = Partner.search(id_domain + [('accumulated_cashback', '>', 0)], order='id')
+            candidates |= Pending.search([('partner_id', 'any', id_domain)]).partner_id
+            candidates._cashback_fold_pending()
+            partners = candidates.filtered(lambda p: p.accumulated_cashback > 0 and p.cashback_precent > 0).sorted('id')
+            partners._settle_month_cashback(period_start)
+
+            settlement_slice.write({
+                'state': 'done',
+                'partner_count': len(partners),
+                'date_done': fields.Datetime.now(),
+            })
+            _logger.info('Cashback settlement for period %s: settled %d partners of ids %s-%s',
+                         period, len(partners), settlement_slice.id_from, settlement_slice.id_to or '')
+            return 1
+
+        self.env['ir.cron']._run_batches(settle_slice, self._get_worker_crons(), time_limit)
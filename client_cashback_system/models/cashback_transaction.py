@@ -1,4 +1,19 @@
 from odoo import models, fields, api
+from odoo.tools.sql import create_index
+
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Transactions moved (and committed) per chunk of the archiving cron
+ARCHIVE_BATCH_SIZE = 5000
+# Columns copied to cashback.transaction.archive
+ARCHIVED_COLUMNS = [
+    'partner_id', 'currency_id', 'invoice_id', 'cashback_percent', 'invoice_amount',
+    'invoice_currency_id', 'cashback_amount', 'cashback_currency_id', 'transaction_date',
+    'status', 'settlement_date', 'notes', 'create_uid', 'create_date', 'write_uid', 'write_date',
+]
 
 
 class CashbackTransaction(models.Model):
@@ -7,6 +22,13 @@ class CashbackTransaction(models.Model):
     _description = 'Cashback Transaction'
     _order = 'transaction_date desc'
 
+    def init(self):
+        # Partner history, newest first
+        create_index(self.env.cr, 'cashback_transaction_partner_date_idx', self._table, ['partner_id', 'transaction_date DESC'])
+        # Month-end settlement: earned transactions of a chunk of partners since the period start
+        create_index(self.env.cr, 'cashback_transaction_earned_partner_date_idx', self._table,
+                     ['partner_id', 'transaction_date'], where="status = 'earned'")
+
     partner_id = fields.Many2one('res.partner', string='Customer', required=True, ondelete='cascade')
 
     currency_id = fields.Many2one(
@@ -16,13 +38,14 @@ class CashbackTransaction(models.Model):
         default=lambda self: self.env.company.currency_id
     )
 
-    invoice_id = fields.Many2one('account.move', string='Invoice', ondelete='cascade')
+    invoice_id = fields.Many2one('account.move', string='Invoice', ondelete='cascade', index='btree_not_null')
     cashback_percent = fields.Float(string='Cashback Percent')
     invoice_amount = fields.Float(string='Invoice Amount')
     invoice_currency_id = fields.Many2one('res.currency', string='Invoice Currency')
     cashback_amount = fields.Float(string='Cashback Amount')
     cashback_currency_id = fields.Many2one('res.currency', string='Cashback Currency')
     transaction_date = fields.Date(string='Transaction Date')
+    rule_ids = fields.Many2many('cashback.rule', string='Applied Rules', readonly=True)
 
     # Status Tracking
     status = fields.Selection(
@@ -47,21 +70,75 @@ class CashbackTransaction(models.Model):
 
     def _mark_as_pending_settlement(self):
         """Mark transaction as pending settlement"""
-        for transaction in self:
-            transaction.status = 'pending_settlement'
+        self.write({'status': 'pending_settlement'})
 
     def _mark_as_settled(self):
         """Mark transaction as settled"""
-        for transaction in self:
-            transaction.status = 'settled'
-            transaction.settlement_date = fields.Date.today()
+        self.write({
+            'status': 'settled',
+            'settlement_date': fields.Date.today(),
+        })
 
     def _mark_as_refunded(self):
         """Mark transaction as refunded"""
-        for transaction in self:
-            transaction.status = 'reset'
-
-
-
-
-
+        self.write({'status': 'reset'})
+
+    @api.model
+    def _cron_archive_transactions(self):
+        """Move old settled and reset transactions to the archive, in committed chunks.
+
+        Balances and lifetime counters come from cashback.ledger, which keeps
+        every entry, so archiving never changes any total.
+        """
+        retention_days = self.env['res.config.settings']._get_cashback_settings().archive_retention_days
+        if retention_days <= 0:
+            return
+        cutoff = fields.Date.today() - timedelta(days=retention_days)
+
+        def archive_batch():
+            archived = self._archive_transactions(cutoff, ARCHIVE_BATCH_SIZE)
+            if archived:
+                _logger.info('Archived %d cashback transactions older than %s', archived, cutoff)
+            return archived
+
+        self.env['ir.cron']._run_batches(
+            archive_batch, self.env.ref('client_cashback_system.ir_cron_cashback_archive_transactions')
+        )
+
+    @api.model
+    def _archive_transactions(self, cutoff, limit):
+        """Move up to ``limit`` final transactions dated before ``cutoff``, return how many"""
+        self.flush_model()
+        columns = ', '.join(ARCHIVED_COLUMNS)
+        rules = self._fields['rule_ids']
+        archive_rules = self.env['cashback.transaction.archive']._fields['rule_ids']
+        # The applied rules are copied from the relation rows as they were
+        # before the delete, all parts of the statement share one snapshot
+        self.env.cr.execute(f"""
+            WITH moved AS (
+                DELETE FROM cashback_transaction
+                 WHERE id IN (SELECT id
+                                FROM cashback_transaction
+                               WHERE status IN ('settled', 'reset')
+                                 AND transaction_date < %s
+                               ORDER BY id
+                               LIMIT %s
+                                 FOR UPDATE SKIP LOCKED)
+             RETURNING id, {columns}
+            ), archived AS (
+                INSERT INTO cashback_transaction_archive (original_id, archive_date, {columns})
+                SELECT id, %s, {columns} FROM moved
+             RETURNING id, original_id
+            ), archived_rules AS (
+                INSERT INTO {archive_rules.relation} ({archive_rules.column1}, {archive_rules.column2})
+                SELECT archived.id, rel.{rules.column2}
+                  FROM archived
+                  JOIN {rules.relation} rel ON rel.{rules.column1} = archived.original_id
+            )
+            SELECT COUNT(*) FROM archived
+        """, [cutoff, limit, fields.Date.today()])
+        archived = self.env.cr.fetchone()[0]
+        if archived:
+            self.invalidate_model()
+            self.env['cashback.ledger'].invalidate_model(['transaction_id'])
+        return archived
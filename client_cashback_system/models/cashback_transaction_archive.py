@@ -0,0 +1,41 @@
+from odoo import models, fields
+from odoo.tools.sql import create_index
+
+
+class CashbackTransactionArchive(models.Model):
+    """Settled and reset cashback transactions moved out of the live table"""
+    _name = 'cashback.transaction.archive'
+    _description = 'Archived Cashback Transaction'
+    _order = 'transaction_date desc, id desc'
+
+    # Same columns as cashback.transaction, see _archive_transactions
+    partner_id = fields.Many2one('res.partner', string='Customer', required=True, ondelete='cascade', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Currency', readonly=True)
+    invoice_id = fields.Many2one('account.move', string='Invoice', ondelete='cascade', index='btree_not_null', readonly=True)
+    cashback_percent = fields.Float(string='Cashback Percent', readonly=True)
+    invoice_amount = fields.Float(string='Invoice Amount', readonly=True)
+    invoice_currency_id = fields.Many2one('res.currency', string='Invoice Currency', readonly=True)
+    cashback_amount = fields.Float(string='Cashback Amount', readonly=True)
+    cashback_currency_id = fields.Many2one('res.currency', string='Cashback Currency', readonly=True)
+    transaction_date = fields.Date(string='Transaction Date', readonly=True)
+    status = fields.Selection(
+        [
+            ('settled', 'Settled'),
+            ('reset', 'Reset'),
+        ],
+        string='Status',
+        readonly=True,
+    )
+    settlement_date = fields.Date(string='Settlement Date', readonly=True)
+    notes = fields.Text(string='Notes', readonly=True)
+    rule_ids = fields.Many2many(
+        'cashback.rule', 'cashback_transaction_archive_rule_rel', 'archive_id', 'rule_id',
+        string='Applied Rules', readonly=True,
+    )
+
+    original_id = fields.Integer(string='Original Transaction', readonly=True, index=True)
+    archive_date = fields.Date(string='Archived On', readonly=True, default=fields.Date.today)
+
+    def init(self):
+        # Partner history, newest first
+        create_index(self.env.cr, 'cashback_transaction_archive_partner_date_idx', self._table, ['partner_id', 'transaction_date DESC'])
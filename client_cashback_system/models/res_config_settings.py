@@ -1,10 +1,14 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.exceptions import ValidationError
+from .cashback_perf import cashback_perf
 
+from collections import namedtuple
 import logging
 
 _logger = logging.getLogger(__name__)
 
+CashbackSettings = namedtuple('CashbackSettings', ['enabled', 'percent', 'redeem_days', 'notification_mode', 'archive_retention_days', 'award_mode'])
+
 class ResConfigSettings(models.TransientModel):
     _inherit = 'res.config.settings'
 
@@ -28,6 +32,36 @@ class ResConfigSettings(models.TransientModel):
         help='Cashback redeem days'
     )
 
+    cashback_notification_mode = fields.Selection(
+        [
+            ('immediate', 'Post immediately'),
+            ('batched', 'Post in background batches'),
+            ('digest', 'Daily summary per customer'),
+        ],
+        string='Cashback Notifications',
+        config_parameter='cashback.notification_mode',
+        default='immediate',
+        help='How cashback events are written to the chatter'
+    )
+
+    cashback_award_mode = fields.Selection(
+        [
+            ('sync', 'When the invoice is posted'),
+            ('async', 'In the background'),
+        ],
+        string='Cashback Award',
+        config_parameter='cashback.award_mode',
+        default='sync',
+        help='Award cashback inside the posting transaction, or queue it so posting stays fast'
+    )
+
+    cashback_archive_retention_days = fields.Integer(
+        string='Cashback History Retention',
+        config_parameter='cashback.archive_retention_days',
+        default=0,
+        help='Settled and reset cashback transactions older than this many days are moved to the archive (0 keeps everything)'
+    )
+
     @api.constrains('cashback_enabled', 'cashback_redeem_days', 'cashback_percent')
     def _check_cashback_required_fields(self):
         """Validate that journal and percent are set when cashback is enabled"""
@@ -39,15 +73,37 @@ class ResConfigSettings(models.TransientModel):
                     raise ValidationError('Cashback Percentage must be greater than 0 when Cashback is enabled')
 
 
+    @api.model
+    @tools.ormcache()
+    def _get_cashback_settings(self):
+        """Return the typed cashback settings, memoized in the registry cache"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        return CashbackSettings(
+            enabled=ICP.get_param('cashback.enabled') == 'True',
+            percent=int(ICP.get_param('cashback.precent') or 0),
+            redeem_days=int(ICP.get_param('cashback.redeem_days') or 90),
+            notification_mode=ICP.get_param('cashback.notification_mode') or 'immediate',
+            archive_retention_days=int(ICP.get_param('cashback.archive_retention_days') or 0),
+            award_mode=ICP.get_param('cashback.award_mode') or 'sync',
+        )
+
+    @cashback_perf('settings_save')
     def set_values(self):
-        """Save settings and populate cashback percent to all contacts"""
+        """Save settings; the global percent applies to every contact without an override"""
+        old_redeem_days = self._get_cashback_settings().redeem_days
         super().set_values()
+        # Parameter writes already clear the registry cache, this keeps the
+        # cached settings correct even if they are saved without changes
+        self.env.registry.clear_cache()
+
+        if self._get_cashback_settings().redeem_days != old_redeem_days:
+            self.env['res.partner']._recompute_next_redeem_dates()
 
-        if self.cashback_enabled:
-            # Set cashback percent to all existing contacts
-            partners = self.env['res.partner'].search([])
-            for partner in partners:
-                partner.cashback_precent = self.cashback_precent
+    def action_apply_cashback_percent_to_all(self):
+        """Drop all per-contact overrides in the background"""
+        self.execute()
+        self.env['ir.config_parameter'].sudo().set_param('cashback.apply_percent_to_all', True)
+        self.env.ref('client_cashback_system.ir_cron_cashback_apply_percent')._trigger()
 
 
     @api.onchange('cashback_enabled')
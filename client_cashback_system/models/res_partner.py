@@ -1,12 +1,45 @@
 from odoo import models, fields, api
+from odoo.exceptions import UserError, ValidationError
+from odoo.osv import expression
+from odoo.tools import mute_logger
+from odoo.tools.sql import create_index
+from .cashback_perf import cashback_perf
 
+from collections import defaultdict
 from datetime import datetime, timedelta
-from markupsafe import Markup
+from psycopg2.errors import SerializationFailure
 
 import logging
+import operator
 
 _logger = logging.getLogger(__name__)
 
+# Partners settled (and committed) per chunk of the month-end settlement
+SETTLEMENT_BATCH_SIZE = 500
+# Partners reset to the global percent per chunk of the "apply to all" job
+APPLY_PERCENT_BATCH_SIZE = 5000
+
+# Partner columns written in SQL by the balance service
+CASHBACK_BALANCE_FIELDS = [
+    'accumulated_cashback',
+    'cashback_balans',
+    'cashback_lifetime_earned',
+    'cashback_lifetime_redeemed',
+    'cashback_lifetime_reset',
+    'cashback_last_activity_date',
+    'cashback_balance_version',
+    'cashback_balance_write_date',
+]
+
+PERCENT_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
 class ResPartner(models.Model):
     _inherit = 'res.partner'
 
@@ -18,11 +51,23 @@ class ResPartner(models.Model):
         default=lambda self: self.env.company.currency_id
     )
 
+    # Effective percent: the partner's own override, otherwise the global setting
     cashback_precent = fields.Integer(string="Cashback Precent",
                                       help='Cashback percentage for this contact',
-                                      default=lambda self: self._get_default_cashback_percent()
+                                      compute='_compute_cashback_precent',
+                                      inverse='_inverse_cashback_precent',
+                                      search='_search_cashback_precent',
+    )
+    cashback_precent_override = fields.Integer(
+        string="Cashback Precent Override",
+        help="Cashback percentage set explicitly for this contact",
+    )
+    cashback_precent_custom = fields.Boolean(
+        string="Custom Cashback Precent",
+        help="Use the contact's own cashback percentage instead of the global one",
     )
 
+    # Both balances are materialized from cashback.ledger entries, never written directly
     cashback_balans = fields.Monetary(
         string="Cashback Balans",
         help="Cashback for this contact",
@@ -48,130 +93,558 @@ class ResPartner(models.Model):
         readonly=True
     )
 
+    # Kept current by cashback.redemption, so redemption checks need no subquery
+    last_redemption_date = fields.Date(
+        string="Last Cashback Redemption",
+        readonly=True,
+        index=True,
+    )
+    next_redeem_date = fields.Date(
+        string="Next Cashback Redemption",
+        help="First day the contact may redeem cashback again",
+        readonly=True,
+        index=True,
+    )
+
+    cashback_ledger_ids = fields.One2many(
+        'cashback.ledger',
+        'partner_id',
+        string="Cashback Ledger",
+        readonly=True
+    )
+
+    # Summary counters, incremented by the balance service with every ledger entry
+    cashback_lifetime_earned = fields.Monetary(
+        string="Lifetime Earned Cashback",
+        readonly=True,
+        default=0.0,
+    )
+    cashback_lifetime_redeemed = fields.Monetary(
+        string="Lifetime Redeemed Cashback",
+        help="Redeemed cashback, without redemptions of cancelled orders",
+        readonly=True,
+        default=0.0,
+    )
+    cashback_lifetime_reset = fields.Monetary(
+        string="Lifetime Reset Cashback",
+        help="Accumulated cashback forfeited because of overdue invoices",
+        readonly=True,
+        default=0.0,
+    )
+    cashback_last_activity_date = fields.Date(
+        string="Last Cashback Activity",
+        readonly=True,
+    )
+
+    # Bumped with every change of the balances or the next redemption date,
+    # so API clients can revalidate cheaply (see controllers/main.py)
+    cashback_balance_version = fields.Integer(
+        string="Cashback Balance Version",
+        readonly=True,
+        default=0,
+        copy=False,
+    )
+    cashback_balance_write_date = fields.Datetime(
+        string="Cashback Balance Changed On",
+        readonly=True,
+        copy=False,
+    )
+
+
+    def init(self):
+        super().init()
+        # Month-end settlement walks only partners with accumulated cashback, in id order
+        create_index(self.env.cr, 'res_partner_accumulated_cashback_idx', self._table,
+                     ['id'], where='accumulated_cashback > 0')
+        # Partners with an explicit cashback percent
+        create_index(self.env.cr, 'res_partner_cashback_precent_override_idx', self._table,
+                     ['cashback_precent_override'], where='cashback_precent_custom')
 
     def _compute_cashback_enabled(self):
         """Check if cashback is enabled in settings"""
-        cashback_enabled_param = self.env['ir.config_parameter'].sudo().get_param('cashback.enabled')
-        is_enabled = cashback_enabled_param == 'True'
+        is_enabled = self.env['res.config.settings']._get_cashback_settings().enabled
         for record in self:
             record.cashback_enabled = is_enabled
 
 
     def _get_default_cashback_percent(self):
         """Get default cashback percent from settings"""
-        cashback_enabled = self.env['ir.config_parameter'].sudo().get_param('cashback.enabled')
-        if cashback_enabled == 'True':
-            cashback_percent = self.env['ir.config_parameter'].sudo().get_param('cashback.precent', '0')
-            return int(cashback_percent)
-        return 0
+        settings = self.env['res.config.settings']._get_cashback_settings()
+        return settings.percent if settings.enabled else 0
+
+    def _get_cashback_percents(self):
+        """Return the effective cashback percent of every partner in the recordset"""
+        default_percent = self._get_default_cashback_percent()
+        return {
+            partner.id: partner.cashback_precent_override if partner.cashback_precent_custom else default_percent
+            for partner in self
+        }
+
+    @api.depends('cashback_precent_custom', 'cashback_precent_override')
+    def _compute_cashback_precent(self):
+        percents = self._get_cashback_percents()
+        for partner in self:
+            partner.cashback_precent = percents[partner.id]
+
+    def _inverse_cashback_precent(self):
+        default_percent = self._get_default_cashback_percent()
+        for partner in self:
+            # Keeping the global percent unless the value really differs from it
+            if not partner.cashback_precent_custom and partner.cashback_precent == default_percent:
+                continue
+            partner.write({
+                'cashback_precent_custom': True,
+                'cashback_precent_override': partner.cashback_precent,
+            })
+
+    def _search_cashback_precent(self, operator, value):
+        if operator not in PERCENT_OPERATORS:
+            raise UserError('Operation not supported on Cashback Precent: %s' % operator)
+        custom_domain = [
+            ('cashback_precent_custom', '=', True),
+            ('cashback_precent_override', operator, value),
+        ]
+        if PERCENT_OPERATORS[operator](self._get_default_cashback_percent(), value or 0):
+            return expression.OR([custom_domain, [('cashback_precent_custom', '=', False)]])
+        return custom_domain
+
+    def action_reset_cashback_precent(self):
+        """Make the partners follow the global cashback percent again"""
+        self.write({
+            'cashback_precent_custom': False,
+            'cashback_precent_override': 0,
+        })
+
+    @api.model
+    def _cron_apply_cashback_percent_to_all(self):
+        """Remove percent overrides in chunks, when requested from the settings"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        if not ICP.get_param('cashback.apply_percent_to_all'):
+            return
+
+        def reset_batch():
+            partners = self.with_context(active_test=False).search(
+                [('cashback_precent_custom', '=', True)], limit=APPLY_PERCENT_BATCH_SIZE
+            )
+            if not partners:
+                ICP.set_param('cashback.apply_percent_to_all', False)
+                return 0
+            partners.action_reset_cashback_precent()
+            _logger.info('Global cashback percent applied to %d more partners', len(partners))
+            return len(partners)
+
+        self.env['ir.cron']._run_batches(
+            reset_batch, self.env.ref('client_cashback_system.ir_cron_cashback_apply_percent')
+        )
+
+    def _update_redemption_dates(self):
+        """Refresh last and next redemption dates of the partners in one grouped query"""
+        if not self:
+            return
+        last_dates = dict(self.env['cashback.redemption']._read_group(
+            [('partner_id', 'in', self.ids)],
+            ['partner_id'],
+            ['redemption_date:max'],
+        ))
+        redeem_days = self.env['res.config.settings']._get_cashback_settings().redeem_days
+        # Partners sharing the same last redemption date are written together
+        partners_by_date = defaultdict(lambda: self.browse())
+        for partner in self:
+            partners_by_date[last_dates.get(partner) or False] |= partner
+        for last_date, partners in partners_by_date.items():
+            partners.write({
+                'last_redemption_date': last_date,
+                'next_redeem_date': last_date and last_date + timedelta(days=redeem_days),
+            })
+        self._bump_cashback_version()
+
+    def _bump_cashback_version(self):
+        """Mark the partners' cashback figures as changed for API clients"""
+        if not self:
+            return
+        self.env.cr.execute("""
+            UPDATE res_partner
+               SET cashback_balance_version = COALESCE(cashback_balance_version, 0) + 1,
+                   cashback_balance_write_date = NOW() AT TIME ZONE 'UTC'
+             WHERE id = ANY(%s)
+        """, [self.ids])
+        self.invalidate_recordset(['cashback_balance_version', 'cashback_balance_write_date'])
+
+    @api.model
+    def _recompute_next_redeem_dates(self):
+        """Shift every next redemption date after a change of the redeem days"""
+        redeem_days = self.env['res.config.settings']._get_cashback_settings().redeem_days
+        self.flush_model(['last_redemption_date'])
+        self.env.cr.execute("""
+            UPDATE res_partner
+               SET next_redeem_date = last_redemption_date + %s,
+                   cashback_balance_version = COALESCE(cashback_balance_version, 0) + 1,
+                   cashback_balance_write_date = NOW() AT TIME ZONE 'UTC'
+             WHERE last_redemption_date IS NOT NULL
+               AND next_redeem_date IS DISTINCT FROM last_redemption_date + %s
+        """, [redeem_days, redeem_days])
+        self.invalidate_model(['next_redeem_date', 'cashback_balance_version', 'cashback_balance_write_date'])
+
+    # ------------------------#
+    # Cashback Balance Service #
+    # ------------------------#
+
+    def _cashback_lock(self):
+        """Lock the partner rows until the transaction ends, before deciding on their balances.
+
+        Under repeatable read a lock only helps if the rows did not change since
+        the transaction's snapshot. A row lock (unlike an advisory lock) fails
+        right away with a serialization error otherwise, so the request is
+        retried on a fresh snapshot instead of working with a stale balance.
+        """
+        self.flush_recordset(CASHBACK_BALANCE_FIELDS)
+        self.env.cr.execute("""
+            SELECT id FROM res_partner WHERE id = ANY(%s) ORDER BY id FOR NO KEY UPDATE
+        """, [self.ids])
+        self.invalidate_recordset(CASHBACK_BALANCE_FIELDS)
+
+    @api.model
+    def _cashback_apply_deltas(self, deltas, activity=None):
+        """Atomically add ``{partner_id: (accumulated_delta, balance_delta)}`` to partner balances.
+
+        All partners are incremented in one in-database UPDATE (rows are locked in
+        id order to avoid deadlocks), so concurrent workers never overwrite each
+        other's changes. A change that would make a cashback balance negative is
+        refused, which prevents double spending of the same balance.
+
+        ``activity`` optionally holds ``{partner_id: (earned, redeemed, reset, date)}``
+        added to the lifetime counters in the same statement.
+        """
+        deltas = {partner_id: delta for partner_id, delta in deltas.items() if any(delta)}
+        activity = activity or {}
+        if not deltas and not activity:
+            return
+        partners = self.browse(sorted(set(deltas) | set(activity)))
+        partners._cashback_lock()
+        partners._cashback_update_balances(deltas, activity)
+
+    def _cashback_fold_pending(self, nowait=False):
+        """Add the pending earned cashback of these partners to their balances.
+
+        With ``nowait`` partners locked or changed by a concurrent transaction
+        are left for a later fold instead of waiting on them. Returns the
+        partners whose rows were locked and folded.
+        """
+        if not self:
+            return self
+        if not nowait:
+            self._cashback_lock()
+            self._cashback_update_balances({}, {})
+            return self
+
+        self.flush_recordset(CASHBACK_BALANCE_FIELDS)
+        try:
+            with self.env.cr.savepoint(flush=False), mute_logger('odoo.sql_db'):
+                self.env.cr.execute("""
+                    SELECT id FROM res_partner WHERE id = ANY(%s) ORDER BY id FOR NO KEY UPDATE SKIP LOCKED
+                """, [self.ids])
+                locked = self.browse(row[0] for row in self.env.cr.fetchall())
+                locked._cashback_update_balances({}, {})
+        except SerializationFailure:
+            # Changed since our snapshot: the transaction that changed it folds next time
+            _logger.debug('Partners %s changed concurrently, pending cashback left for later', self.ids)
+            self.env['cashback.balance.pending'].invalidate_model()
+            return self.browse()
+        return locked
+
+    def _cashback_update_balances(self, deltas, activity):
+        """Apply the deltas and the pending increments of these partners, whose rows are locked"""
+        if not self:
+            return
+        deltas = {partner_id: list(delta) for partner_id, delta in deltas.items()}
+        activity = {partner_id: list(counters) for partner_id, counters in activity.items()}
+
+        # Earned cashback queued by concurrent invoices, safe to take under the row lock
+        self.env['cashback.balance.pending'].flush_model()
+        self.env.cr.execute("""
+            DELETE FROM cashback_balance_pending WHERE partner_id = ANY(%s) RETURNING partner_id, amount, date
+        """, [self.ids])
+        pending = self.env.cr.fetchall()
+        if pending:
+            self.env['cashback.balance.pending'].invalidate_model()
+        for partner_id, amount, date in pending:
+            deltas.setdefault(partner_id, [0.0, 0.0])[0] += amount
+            counters = activity.setdefault(partner_id, [0.0, 0.0, 0.0, None])
+            counters[0] += amount
+            counters[3] = max(counters[3] or date, date)
+
+        partner_ids = sorted(set(deltas) | set(activity))
+        if not partner_ids:
+            return
+        no_delta, no_activity = (0.0, 0.0), (0.0, 0.0, 0.0, None)
+        self.env.cr.execute("""
+            UPDATE res_partner p
+               SET accumulated_cashback = COALESCE(p.accumulated_cashback, 0) + v.accumulated,
+                   cashback_balans = COALESCE(p.cashback_balans, 0) + v.balance,
+                   cashback_lifetime_earned = COALESCE(p.cashback_lifetime_earned, 0) + v.earned,
+                   cashback_lifetime_redeemed = COALESCE(p.cashback_lifetime_redeemed, 0) + v.redeemed,
+                   cashback_lifetime_reset = COALESCE(p.cashback_lifetime_reset, 0) + v.reset,
+                   cashback_last_activity_date = GREATEST(p.cashback_last_activity_date, v.activity_date),
+                   cashback_balance_version = COALESCE(p.cashback_balance_version, 0) + 1,
+                   cashback_balance_write_date = NOW() AT TIME ZONE 'UTC'
+              FROM (SELECT unnest(%s::int[]) AS id,
+                           unnest(%s::numeric[]) AS accumulated,
+                           unnest(%s::numeric[]) AS balance,
+                           unnest(%s::numeric[]) AS earned,
+                           unnest(%s::numeric[]) AS redeemed,
+                           unnest(%s::numeric[]) AS reset,
+                           unnest(%s::date[]) AS activity_date) v
+             WHERE p.id = v.id
+               AND (v.balance >= 0 OR COALESCE(p.cashback_balans, 0) + v.balance >= 0)
+         RETURNING p.id
+        """, [
+            partner_ids,
+            [deltas.get(partner_id, no_delta)[0] for partner_id in partner_ids],
+            [deltas.get(partner_id, no_delta)[1] for partner_id in partner_ids],
+            [activity.get(partner_id, no_activity)[0] for partner_id in partner_ids],
+            [activity.get(partner_id, no_activity)[1] for partner_id in partner_ids],
+            [activity.get(partner_id, no_activity)[2] for partner_id in partner_ids],
+            [activity.get(partner_id, no_activity)[3] for partner_id in partner_ids],
+        ])
+        updated_ids = {row[0] for row in self.env.cr.fetchall()}
+
+        # Keeping the ORM cache in sync with the database
+        self.invalidate_recordset(CASHBACK_BALANCE_FIELDS)
+
+        refused = self.browse(set(partner_ids) - updated_ids)
+        if refused:
+            raise ValidationError(
+                'Insufficient cashback balance for %s' % ', '.join(refused.mapped('display_name'))
+            )
 
     # ------------------------#
     # Cashback Monthly Check  #
     # ------------------------#
 
+    def _get_partners_debt(self):
+        """Return the outstanding receivable of every partner, in one grouped query.
+
+        Debt booked on any contact of the company counts for the whole company.
+        """
+        commercial_debts = dict(self.env['account.move.line']._read_group(
+            [
+                ('partner_id.commercial_partner_id', 'in', self.commercial_partner_id.ids),
+                ('company_id', 'child_of', self.env.company.root_id.id),
+                ('account_id.account_type', '=', 'asset_receivable'),
+                ('parent_state', '=', 'posted'),
+                ('reconciled', '=', False),
+            ],
+            ['partner_id.commercial_partner_id'],
+            ['amount_residual:sum'],
+        ))
+        return {partner.id: commercial_debts.get(partner.commercial_partner_id, 0.0) for partner in self}
+
     def _get_partner_debt(self):
         """Return the total outstanding amount the customer owes."""
         self.ensure_one()
-        return self.credit
-
-    def process_end_of_month_cashback(self):
-        odoo_bot = self.env.ref('base.partner_root')
-        partners = self.search([
-            ('cashback_precent', '>', 0),
-            ('accumulated_cashback', '>', 0)
-        ])
-
-        for partner in partners:
-            outstanding_debt = partner._get_partner_debt()
-
+        return self._get_partners_debt()[self.id]
+
+    def process_end_of_month_cashback(self, start_period=True):
+        """Coordinate the month-end settlement: plan partner slices, wake the
+        workers, and close the period once every slice is settled.
+
+        Only the monthly run (``start_period``) opens a new period; the
+        follow-up checks just resume or close the one in progress.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        Slice = self.env['cashback.settlement.slice']
+        batch_size = int(ICP.get_param('cashback.settlement_batch_size', SETTLEMENT_BATCH_SIZE))
+
+        period = ICP.get_param('cashback.settlement_period')
+        if not period:
+            if not start_period:
+                return
+            period = fields.Date.to_string(fields.Date.today().replace(day=1))
+            if period == ICP.get_param('cashback.settlement_closed_period'):
+                _logger.info('Cashback settlement for period %s already done', period)
+                return
+            ICP.set_param('cashback.settlement_period', period)
+        period_start = fields.Date.from_string(period)
+
+        if not Slice.search_count([('period', '=', period_start)]):
+            # A run interrupted before slices existed resumes after its cursor
+            last_partner_id = int(ICP.get_param('cashback.settlement_last_partner_id', 0))
+            Slice._plan_period(period_start, batch_size, start_id=last_partner_id)
+            ICP.set_param('cashback.settlement_last_partner_id', False)
+            self.env['ir.cron']._commit_batch()
+
+        if Slice._is_period_done(period_start):
+            # Period finished: clearing it for the next month
+            ICP.set_param('cashback.settlement_period', False)
+            ICP.set_param('cashback.settlement_closed_period', period)
+            self.env['ir.cron']._commit_batch()
+            _logger.info('Cashback settlement for period %s finished', period)
+            return
+
+        Slice._trigger_workers()
+        # Checking again later, in case a worker stopped without waking the coordinator
+        self.env.ref('client_cashback_system.ir_cron_cashback_settlement_check')._trigger(
+            fields.Datetime.now() + timedelta(minutes=10)
+        )
+
+    @cashback_perf('month_settlement')
+    def _settle_month_cashback(self, period_start):
+        """Settle or reset accumulated cashback of the given partners"""
+        today = fields.Date.today()
+        # Settling everything earned so far, pending increments included
+        self._cashback_fold_pending()
+
+        # Loading debts and earned transactions of the whole chunk at once
+        debts = self._get_partners_debt()
+        earned_by_partner = self.env['cashback.transaction'].search([
+            ('partner_id', 'in', self.ids),
+            ('status', '=', 'earned'),
+            ('transaction_date', '>=', period_start)
+        ]).grouped('partner_id')
+        no_transactions = self.env['cashback.transaction']
+
+        # Splitting partners before any writes: no debt -> settle, debt -> reset
+        to_settle = self.filtered(lambda p: debts[p.id] == 0)
+        to_reset = self - to_settle
+
+        # Snapshot of amounts before the balances are changed
+        accumulated = {partner.id: partner.accumulated_cashback for partner in self}
+        balances = {partner.id: partner.cashback_balans for partner in to_settle}
+
+        settled_transactions = no_transactions.union(
+            *(earned_by_partner.get(partner, no_transactions) for partner in to_settle)
+        )
+        reset_transactions = no_transactions.union(
+            *(earned_by_partner.get(partner, no_transactions) for partner in to_reset)
+        )
+        settled_transactions._mark_as_settled()
+        reset_transactions._mark_as_refunded()
+
+        transaction_vals = []
+        events = []
+        for partner in self:
             # Company Main Currency
             if partner.company_id:
                 currency = partner.company_id.currency_id
             else:
                 currency = self.env.company.currency_id
 
-            _logger.info('Main Company Currency: %s', currency.name)
-
-            current_month_start = fields.Date.today().replace(day=1)
-            earned_transactions = self.env['cashback.transaction'].search([
-                ('partner_id', '=', partner.id),
-                ('status', '=', 'earned'),
-                ('transaction_date', '>=', current_month_start)
-            ])
-
-            if outstanding_debt == 0:
-                # No debt: Transfer accumulated to balance
-                partner.cashback_balans += partner.accumulated_cashback
-
-                earned_transactions._mark_as_settled()
-
-                message = Markup(f"""
-                            <strong>✓ End of Month Cashback Settlement - Completed</strong><br/>
-                            <ul>
-                                <li><strong>Settlement Date:</strong> {fields.Date.today().strftime('%Y-%m-%d')}</li>
-                                <li><strong>Accumulated Cashback Transferred:</strong> {partner.accumulated_cashback:,.2f} {currency.name}</li>
-                                <li><strong>New Cashback Balance:</strong> {partner.cashback_balans + partner.accumulated_cashback:,.2f} {currency.name}</li>
-                                <li><strong>Outstanding Invoices:</strong> None</li>
-                                <li><strong>Status:</strong> <span style="color: green;"><strong>SETTLED</strong></span></li>
-                            </ul>
-                            """)
-                partner.message_post(
-                    body=message,
-                    subject='✓ Monthly Cashback Settlement - Completed',
-                    message_type='comment',
-                    subtype_xmlid='mail.mt_comment',
-                    author_id = odoo_bot.id,
-                )
-
-                # Creating settlement record
-                self.env['cashback.transaction'].create({
+            amount = accumulated[partner.id]
+
+            if partner in to_settle:
+                events.append((partner, 'settled', {
+                    'date': today.strftime('%Y-%m-%d'),
+                    'reference': 'Monthly settlement',
+                    'amount': amount,
+                    'balance': balances[partner.id] + amount,
+                    'currency': currency.name,
+                }))
+
+                # Settlement record
+                transaction_vals.append({
                     'partner_id': partner.id,
                     'cashback_percent': 0,
                     'invoice_amount': 0,
                     'invoice_currency_id': currency.id,
-                    'cashback_amount': partner.accumulated_cashback,
+                    'cashback_amount': amount,
                     'cashback_currency_id': currency.id,
-                    'transaction_date': fields.Date.today(),
+                    'transaction_date': today,
                     'status': 'settled',
-                    'settlement_date': fields.Date.today(),
+                    'settlement_date': today,
                     'notes': f'Monthly settlement transfer - No outstanding debt. Accumulated amount transferred to balance.'
                 })
-                partner.accumulated_cashback = 0
 
             else:
-                earned_transactions._mark_as_refunded()
-                message = f"""
-                               <strong>⏳ End of Month Cashback Settlement - Reset</strong><br/>
-                               <ul>
-                                   <li><strong>Settlement Date Attempted:</strong> {fields.Date.today().strftime('%Y-%m-%d')}</li>
-                                   <li><strong>Accumulated Cashback (Before):</strong> {partner.accumulated_cashback:,.2f} {currency.name}</li>
-                                   <li><strong>Overdue Invoices:</strong> {outstanding_debt:,.2f} {currency.name}</li>
-                                   <li><strong>Status:</strong> <span style="color: orange;"><strong>ACCUMULATED CASHBACK SET TO 0</strong></span></li>
-                                   <li><strong>Action:</strong> Accumulated cashback has been reset. Once all overdue invoices are paid, pending transactions will be settled.</li>
-                               </ul>
-                               """
-                partner.message_post(
-                    body=message,
-                    subject='⏳ Monthly Cashback Settlement - Reset',
-                    message_type='comment',
-                    subtype_xmlid='mail.mt_comment',
-                    author_id=odoo_bot.id,
-                )
-
-                self.env['cashback.transaction'].create({
+                outstanding_debt = debts[partner.id]
+                events.append((partner, 'reset', {
+                    'date': today.strftime('%Y-%m-%d'),
+                    'reference': 'Monthly settlement',
+                    'amount': amount,
+                    'debt': outstanding_debt,
+                    'currency': currency.name,
+                }))
+
+                transaction_vals.append({
                     'partner_id': partner.id,
                     'cashback_percent': 0,
                     'invoice_amount': outstanding_debt,
                     'invoice_currency_id': currency.id,
-                    'cashback_amount': partner.accumulated_cashback,
+                    'cashback_amount': amount,
                     'cashback_currency_id': currency.id,
-                    'transaction_date': fields.Date.today(),
+                    'transaction_date': today,
                     'status': 'reset',
                     'notes': f'Monthly settlement pending - Outstanding overdue invoices: {outstanding_debt:,.2f} {currency.name}. Accumulated cashback forfeited due to debt.'
                 })
 
-                partner.accumulated_cashback = 0
-
-
-
-
+        self.env['cashback.notification']._notify(events)
+
+        # Creating settlement and reset records in one multi-row create
+        transactions = self.env['cashback.transaction'].create(transaction_vals)
+
+        # Posting the matching ledger entries: settle moves accumulated to
+        # balance, reset forfeits accumulated
+        self.env['cashback.ledger'].create([{
+            'partner_id': transaction.partner_id.id,
+            'company_id': (transaction.partner_id.company_id or self.env.company).id,
+            'currency_id': transaction.cashback_currency_id.id,
+            'entry_type': 'settle' if transaction.status == 'settled' else 'reset',
+            'amount': transaction.cashback_amount,
+            'date': today,
+            'transaction_id': transaction.id,
+            'notes': transaction.notes,
+        } for transaction in transactions])
+
+    def action_view_cashback_history(self):
+        """Open the partner's cashback transactions, loaded page by page"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': f'Cashback History - {self.display_name}',
+            'res_model': 'cashback.transaction',
+            'view_mode': 'list,form',
+            'views': [(self.env.ref('client_cashback_system.view_cashback_transaction_list').id, 'list'), (False, 'form')],
+            'domain': [('partner_id', '=', self.id)],
+            'context': {'default_partner_id': self.id, 'create': False},
+            'limit': 80,
+        }
+
+    def action_view_cashback_redemptions(self):
+        """Open the partner's cashback redemptions, loaded page by page"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': f'Cashback Redemptions - {self.display_name}',
+            'res_model': 'cashback.redemption',
+            'view_mode': 'list,form',
+            'views': [(self.env.ref('client_cashback_system.view_cashback_redemption_list').id, 'list'), (False, 'form')],
+            'domain': [('partner_id', '=', self.id)],
+            'context': {'default_partner_id': self.id, 'create': False},
+            'limit': 80,
+        }
+
+    def action_view_cashback_archive(self):
+        """Open the partner's archived cashback transactions"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': f'Archived Cashback History - {self.display_name}',
+            'res_model': 'cashback.transaction.archive',
+            'view_mode': 'list',
+            'domain': [('partner_id', '=', self.id)],
+            'context': {'create': False},
+            'limit': 80,
+        }
+
+    def action_rebuild_cashback_balances(self):
+        """Verify and repair the selected partners' balances from the ledger"""
+        mismatches = self.env['cashback.ledger']._rebuild_partner_balances(self.ids or None)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Cashback Balances',
+                'message': f'{len(mismatches)} partner balance(s) repaired from the ledger',
+                'type': 'warning' if mismatches else 'success',
+                'sticky': False,
+            },
+        }
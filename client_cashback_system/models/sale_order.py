@@ -1,7 +1,8 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
-from markupsafe import Markup
+from .cashback_perf import cashback_perf
 
+from collections import defaultdict
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -10,56 +11,96 @@ _logger = logging.getLogger(__name__)
 class SaleOrder(models.Model):
     _inherit = 'sale.order'
 
-    def action_confirm(self):
-        """Confirm order and finalize cashback deduction"""
-        result = super().action_confirm()
-
-        for order in self:
-            cashback_lines = order.order_line.filtered(
-                lambda l: 'Cashback' in (l.name or '')
-            )
-
-            cashback_amount = abs(sum(cashback_lines.mapped('price_subtotal')))
-
-            if cashback_amount > 0:
-                pass
-
-        return result
-
-    def action_cancel(self):
-        """Cancel order and restore cashback balance"""
-        odoo_bot = self.env.ref('base.partner_root')
-        for order in self:
-            cashback_lines = order.order_line.filtered(
-                lambda l: 'Cashback' in (l.name or '')
+    def _get_cashback_amounts(self):
+        """Return the redeemed cashback amount per order, in one grouped query"""
+        return {
+            order.id: abs(amount)
+            for order, amount in self.env['sale.order.line']._read_group(
+                [('order_id', 'in', self.ids), ('is_cashback_line', '=', True)],
+                ['order_id'],
+                ['price_subtotal:sum'],
             )
+        }
+
+    def _action_cancel(self):
+        """Cancel orders and restore their cashback, grouped per partner"""
+        self._refund_cashback()
+        return super()._action_cancel()
+
+    @cashback_perf('order_cancel_refund')
+    def _refund_cashback(self):
+        """Give back the cashback redeemed on the orders in one pass"""
+        orders = self.filtered(lambda o: o.state != 'cancel' and o.partner_id)
+        cashback_amounts = orders._get_cashback_amounts()
+        orders = orders.filtered(lambda o: cashback_amounts.get(o.id, 0.0) > 0)
+        if not orders:
+            return
+
+        # Orders cancelled before (and set back to quotation) were already refunded
+        refunded = dict(self.env['cashback.ledger']._read_group(
+            [('sale_order_id', 'in', orders.ids), ('entry_type', '=', 'refund')],
+            ['sale_order_id'],
+            ['amount:sum'],
+        ))
+        redemptions_by_order = self.env['cashback.redemption'].search([
+            ('sale_order_id', 'in', orders.ids),
+        ], order='id').grouped('sale_order_id')
+
+        today = fields.Date.today()
+        ledger_vals = []
+        partner_refunds = defaultdict(lambda: [0.0, []])
+        for order in orders:
+            remaining = cashback_amounts[order.id] - refunded.get(order, 0.0)
+            if order.company_id.currency_id.compare_amounts(remaining, 0.0) <= 0:
+                continue
+            partner_refunds[order.partner_id][0] += remaining
+            partner_refunds[order.partner_id][1].append(order.name)
+
+            entry_vals = {
+                'partner_id': order.partner_id.id,
+                'company_id': order.company_id.id,
+                'currency_id': order.company_id.currency_id.id,
+                'entry_type': 'refund',
+                'date': today,
+                'sale_order_id': order.id,
+                'notes': f'Sales Order {order.name} was cancelled',
+            }
 
-            cashback_amount = abs(sum(cashback_lines.mapped('price_subtotal')))
-
-            if cashback_amount > 0 and order.partner_id:
-                # Restore cashback balance
-                order.partner_id.cashback_balans += cashback_amount
-
-                # Post message to partner chatter
-                currency = order.partner_id.company_id.currency_id
-                message = Markup(f"""
-                           <strong>Cashback Refunded</strong><br/>
-                           <ul>
-                               <li><strong>Reason:</strong> Sales Order {order.name} was cancelled</li>
-                               <li><strong>Refunded Amount:</strong> {cashback_amount:,.2f} {currency.name}</li>
-                               <li><strong>New Cashback Balance:</strong> {order.partner_id.cashback_balans:,.2f} {currency.name}</li>
-                           </ul>
-                           """)
-
-                order.partner_id.message_post(
-                    body=message,
-                    subject='Cashback Refunded - Order Cancelled',
-                    message_type='comment',
-                    subtype_xmlid='mail.mt_comment',
-                    author_id=odoo_bot.id
-                )
-
-        return super().action_cancel()
+            redemptions = redemptions_by_order.get(order)
+            if not redemptions:
+                # Lines redeemed before redemptions were recorded
+                ledger_vals.append(dict(entry_vals, amount=remaining))
+                continue
+
+            # Reversing the original redemptions, so totals reconcile without chatter
+            for redemption in redemptions.filtered(lambda r: r.state == 'redeemed'):
+                if remaining <= 0:
+                    break
+                refund = min(remaining, redemption.redemption_amount)
+                ledger_vals.append(dict(entry_vals, amount=refund, redemption_id=redemption.id))
+                redemption.write({
+                    'state': 'reversed',
+                    'refunded_amount': refund,
+                    'reversal_date': today,
+                })
+                remaining -= refund
+
+        if not ledger_vals:
+            return
+
+        # Restore cashback balances through the ledger, one increment per partner
+        self.env['cashback.ledger'].create(ledger_vals)
+
+        # One consolidated message per partner
+        self.env['cashback.notification']._notify([
+            (partner, 'refunded', {
+                'reference': ', '.join(order_names),
+                'amount': amount,
+                'currency': partner.company_id.currency_id.name or self.env.company.currency_id.name,
+                'balance': partner.cashback_balans,
+            })
+            for partner, (amount, order_names) in partner_refunds.items()
+        ])
 
     def action_open_cashback_wizard(self):
         """Open cashback redemption wizard"""
@@ -80,4 +121,15 @@ class SaleOrder(models.Model):
             'context': {
                 'default_sale_order_id': self.id,
             }
-        }
\ No newline at end of file
+        }
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    is_cashback_line = fields.Boolean(
+        string='Cashback Redemption Line',
+        readonly=True,
+        copy=False,
+        index=True,
+    )
@@ -0,0 +1,343 @@
+"""Load harness for cashback posting, redemption and cancellation.
+
+Generates a synthetic dataset in a scratch database, then runs concurrent
+workers that post invoices, redeem cashback through the redemption wizard
+and cancel the redeemed orders, each on its own cursor. Prints throughput,
+p50/p99 latencies, serialization failures and whether partner balances
+still match the cashback ledger.
+
+Never run it against a production database.
+
+Through the Odoo shell (uses the defaults below)::
+
+    odoo-bin shell -c odoo.conf -d cashback_load < client_cashback_system/scripts/cashback_load.py
+
+As a command line script::
+
+    python client_cashback_system/scripts/cashback_load.py -c odoo.conf -d cashback_load \\
+        --partners 200000 --invoices 500000 --lines 4 --workers 8
+"""
+import argparse
+import logging
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+
+from psycopg2.extensions import TransactionRollbackError
+
+import odoo
+from odoo import api, fields, SUPERUSER_ID
+from odoo.exceptions import UserError, ValidationError
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger('cashback_load')
+
+# Partner reference marking the generated records
+LOAD_REF = 'cashback-load'
+# Records created (and committed) per chunk of the dataset generation
+CREATE_BATCH_SIZE = 1000
+# Retries of an operation that failed on a serialization failure or deadlock
+MAX_RETRIES = 5
+
+DEFAULTS = {
+    'partners': 10000,
+    'invoices': 50000,
+    'lines': 4,
+    'orders': 5000,
+    'workers': 8,
+    'post_batch': 50,
+    'currencies': 'USD,EUR',
+    'seed_balance': 1000.0,
+    'skip_generate': False,
+}
+
+
+class Stats:
+    """Latencies and outcome counters per operation, shared by the workers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.counters = defaultdict(lambda: defaultdict(int))
+
+    def record(self, operation, outcome, seconds=None, size=1):
+        with self.lock:
+            self.counters[operation][outcome] += size
+            if seconds is not None:
+                self.latencies[operation].append(seconds)
+
+    def report(self, elapsed):
+        lines = [f'Load run finished in {elapsed:.1f}s']
+        for operation in sorted(self.counters):
+            counters = self.counters[operation]
+            latencies = sorted(self.latencies[operation])
+            lines.append(
+                f'{operation:>8}: {counters["ok"] / elapsed:8.1f} records/s'
+                f'  p50 {percentile(latencies, 50) * 1000:8.1f}ms'
+                f'  p99 {percentile(latencies, 99) * 1000:8.1f}ms'
+                f'  ok {counters["ok"]}'
+                f'  serialization failures {counters["serialization"]}'
+                f'  refused {counters["refused"]}'
+                f'  errors {counters["error"]}'
+            )
+        return '\n'.join(lines)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run_in_transaction(registry, stats, operation, function, size=1):
+    """Run ``function(env)`` in its own transaction, retrying serialization failures"""
+    for _attempt in range(MAX_RETRIES):
+        start = time.perf_counter()
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            try:
+                result = function(env)
+                cr.commit()
+            except TransactionRollbackError:
+                cr.rollback()
+                stats.record(operation, 'serialization')
+                time.sleep(random.uniform(0.01, 0.1))
+                continue
+            except (ValidationError, UserError):
+                cr.rollback()
+                stats.record(operation, 'refused', time.perf_counter() - start)
+                return None
+            except Exception:
+                cr.rollback()
+                _logger.exception('%s failed', operation)
+                stats.record(operation, 'error')
+                return None
+        stats.record(operation, 'ok', time.perf_counter() - start, size)
+        return result
+    stats.record(operation, 'error')
+    return None
+
+
+# ------------------------#
+# Dataset generation      #
+# ------------------------#
+
+def prepare_settings(env):
+    ICP = env['ir.config_parameter'].sudo()
+    ICP.set_param('cashback.enabled', True)
+    ICP.set_param('cashback.precent', ICP.get_param('cashback.precent') or 5)
+    ICP.set_param('cashback.redeem_days', ICP.get_param('cashback.redeem_days') or 90)
+    env.registry.clear_cache()
+
+
+def prepare_currencies(env, names):
+    """Activate the currencies and give each one a rate for today"""
+    company = env.company
+    currencies = env['res.currency'].with_context(active_test=False).search([('name', 'in', names)])
+    currencies.write({'active': True})
+    for currency in currencies - company.currency_id:
+        if not currency.rate_ids.filtered(lambda r: r.name == fields.Date.today() and r.company_id == company):
+            env['res.currency.rate'].create({
+                'currency_id': currency.id,
+                'company_id': company.id,
+                'name': fields.Date.today(),
+                'rate': random.uniform(0.5, 2.0),
+            })
+    return currencies | company.currency_id
+
+
+def generate_dataset(registry, options):
+    """Create partners, draft invoices and quotations, committing every chunk"""
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        prepare_settings(env)
+        currency_ids = prepare_currencies(env, options['currencies'].split(',')).ids
+        product = env['product.product'].create({
+            'name': 'Cashback Load Product',
+            'type': 'service',
+            'list_price': 100.0,
+            'invoice_policy': 'order',
+        })
+        cr.commit()
+
+        Partner = env['res.partner']
+        for start in range(0, options['partners'], CREATE_BATCH_SIZE):
+            count = min(CREATE_BATCH_SIZE, options['partners'] - start)
+            Partner.create([
+                {'name': f'Load Partner {start + i}', 'is_company': True, 'ref': LOAD_REF}
+                for i in range(count)
+            ])
+            cr.commit()
+            env.invalidate_all()
+        partner_ids = Partner.search([('ref', '=', LOAD_REF)]).ids
+        _logger.info('Generated %d partners', len(partner_ids))
+
+        Move = env['account.move']
+        for start in range(0, options['invoices'], CREATE_BATCH_SIZE):
+            count = min(CREATE_BATCH_SIZE, options['invoices'] - start)
+            Move.create([{
+                'move_type': 'out_invoice',
+                'partner_id': random.choice(partner_ids),
+                'currency_id': random.choice(currency_ids),
+                'invoice_date': fields.Date.today(),
+                'invoice_line_ids': [(0, 0, {
+                    'product_id': product.id,
+                    'quantity': random.randint(1, 5),
+                    'price_unit': round(random.uniform(10, 1000), 2),
+                }) for _line in range(options['lines'])],
+            } for _i in range(count)])
+            cr.commit()
+            env.invalidate_all()
+        _logger.info('Generated %d draft invoices', options['invoices'])
+
+        # Redemption candidates: a settled balance to spend, and a quotation to spend it on
+        redeemers = random.sample(partner_ids, min(options['orders'], len(partner_ids)))
+        for start in range(0, len(redeemers), CREATE_BATCH_SIZE):
+            chunk = redeemers[start:start + CREATE_BATCH_SIZE]
+            for entry_type in ('earn', 'settle'):
+                env['cashback.ledger'].create([{
+                    'partner_id': partner_id,
+                    'entry_type': entry_type,
+                    'amount': options['seed_balance'],
+                    'notes': 'Load harness seed balance',
+                } for partner_id in chunk])
+            env['sale.order'].create([{
+                'partner_id': partner_id,
+                'order_line': [(0, 0, {'product_id': product.id, 'product_uom_qty': 10})],
+            } for partner_id in chunk])
+            cr.commit()
+            env.invalidate_all()
+        _logger.info('Seeded balances and quotations of %d partners', len(redeemers))
+
+
+# ------------------------#
+# Workers                 #
+# ------------------------#
+
+def post_invoices(move_ids):
+    def function(env):
+        env['account.move'].browse(move_ids).action_post()
+    return function
+
+
+def redeem(order_id):
+    def function(env):
+        order = env['sale.order'].browse(order_id)
+        amount = min(order.amount_total, order.partner_id.cashback_balans) / 2
+        wizard = env['cashback.redemption.wizard'].create({
+            'sale_order_id': order.id,
+            'redemption_amount': round(amount, 2),
+        })
+        wizard.action_redeem_cashback()
+        return order_id
+    return function
+
+
+def cancel(order_id):
+    def function(env):
+        env['sale.order'].browse(order_id).with_context(disable_cancel_warning=True).action_cancel()
+    return function
+
+
+def worker(registry, stats, work, cancellations, stop):
+    while not stop.is_set():
+        # Cancelling redeemed orders first keeps redeem and cancel interleaved
+        try:
+            order_id = cancellations.get_nowait()
+            run_in_transaction(registry, stats, 'cancel', cancel(order_id))
+            continue
+        except queue.Empty:
+            pass
+        try:
+            operation, payload = work.get_nowait()
+        except queue.Empty:
+            return
+        if operation == 'post':
+            run_in_transaction(registry, stats, 'post', post_invoices(payload), size=len(payload))
+        elif run_in_transaction(registry, stats, 'redeem', redeem(payload)):
+            cancellations.put(payload)
+
+
+def run_load(registry, options):
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        partner_ids = env['res.partner'].search([('ref', '=', LOAD_REF)]).ids
+        move_ids = env['account.move'].search([
+            ('partner_id', 'in', partner_ids), ('state', '=', 'draft'), ('move_type', '=', 'out_invoice'),
+        ]).ids
+        order_ids = env['sale.order'].search([
+            ('partner_id', 'in', partner_ids), ('state', '=', 'draft'),
+        ]).ids
+
+    # Mixed workload: invoice batches and redemptions shuffled together
+    tasks = [('post', move_ids[i:i + options['post_batch']]) for i in range(0, len(move_ids), options['post_batch'])]
+    tasks += [('redeem', order_id) for order_id in order_ids]
+    random.shuffle(tasks)
+    work = queue.Queue()
+    for task in tasks:
+        work.put(task)
+    cancellations = queue.Queue()
+
+    _logger.info('Running %d tasks on %d workers', len(tasks), options['workers'])
+    stats = Stats()
+    stop = threading.Event()
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(registry, stats, work, cancellations, stop), name=f'cashback-load-{i}')
+        for i in range(options['workers'])
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(stats.report(elapsed))
+
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        mismatches = env['cashback.ledger']._rebuild_partner_balances(partner_ids, repair=False)
+        print(f'Partner balances matching the ledger: {len(partner_ids) - len(mismatches)}/{len(partner_ids)}')
+        for row in mismatches[:20]:
+            print('  partner %s: accumulated %s (ledger %s), balance %s (ledger %s)' % row)
+    return stats, mismatches
+
+
+def main(dbname, options):
+    registry = Registry(dbname)
+    if not options['skip_generate']:
+        generate_dataset(registry, options)
+    return run_load(registry, options)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Cashback load harness')
+    parser.add_argument('-c', '--config', help='Odoo configuration file')
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--partners', type=int, default=DEFAULTS['partners'])
+    parser.add_argument('--invoices', type=int, default=DEFAULTS['invoices'])
+    parser.add_argument('--lines', type=int, default=DEFAULTS['lines'], help='Lines per invoice')
+    parser.add_argument('--orders', type=int, default=DEFAULTS['orders'], help='Quotations to redeem and cancel')
+    parser.add_argument('--workers', type=int, default=DEFAULTS['workers'])
+    parser.add_argument('--post-batch', type=int, default=DEFAULTS['post_batch'], help='Invoices posted per transaction')
+    parser.add_argument('--currencies', default=DEFAULTS['currencies'], help='Comma separated invoice currencies')
+    parser.add_argument('--seed-balance', type=float, default=DEFAULTS['seed_balance'])
+    parser.add_argument('--skip-generate', action='store_true', help='Reuse the dataset of a previous run')
+    return parser.parse_args()
+
+
+if __name__ == '__main__' and 'env' not in globals():
+    args = parse_args()
+    odoo.tools.config.parse_config(['-c', args.config] if args.config else [])
+    logging.basicConfig(level=logging.INFO)
+    main(args.database, {key: value for key, value in vars(args).items() if key in DEFAULTS})
+elif 'env' in globals():
+    # odoo-bin shell: the shell's own transaction is left untouched
+    main(env.cr.dbname, dict(DEFAULTS))  # noqa: F821
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+from . import test_settlement
+from . import test_backfill
+from . import test_balance_controller
+from . import test_order_cancel
+from . import test_rules
+from . import test_indexes
+from . import test_cashback_perf
+from . import test_concurrency
\ No newline at end of file
@@ -0,0 +1,53 @@
+from odoo import Command, fields
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+
+class CashbackCommon(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ICP = cls.env['ir.config_parameter'].sudo()
+        ICP.set_param('cashback.enabled', True)
+        ICP.set_param('cashback.precent', 5)
+        ICP.set_param('cashback.redeem_days', 90)
+        cls.env.registry.clear_cache()
+
+        cls.today = fields.Date.today()
+        cls.period_start = cls.today.replace(day=1)
+
+    @classmethod
+    def _post_invoice(cls, partner, amount=1000.0, **kwargs):
+        return cls.init_invoice(
+            'out_invoice', partner=partner, invoice_date=cls.today, amounts=[amount], post=True, **kwargs
+        )
+
+    @classmethod
+    def _pay(cls, invoices):
+        cls.env['account.payment.register'].with_context(
+            active_model='account.move', active_ids=invoices.ids
+        ).create({})._create_payments()
+
+    @classmethod
+    def _seed_balance(cls, partner, amount):
+        """Give the partner a redeemable balance through earn and settle ledger entries"""
+        for entry_type in ('earn', 'settle'):
+            cls.env['cashback.ledger'].create({
+                'partner_id': partner.id,
+                'entry_type': entry_type,
+                'amount': amount,
+            })
+
+    @classmethod
+    def _create_order(cls, partner, amount=1000.0):
+        return cls.env['sale.order'].create({
+            'partner_id': partner.id,
+            'order_line': [Command.create({'product_id': cls.product_a.id, 'price_unit': amount, 'tax_id': False})],
+        })
+
+    @classmethod
+    def _redeem(cls, order, amount):
+        return cls.env['cashback.redemption.wizard'].create({
+            'sale_order_id': order.id,
+            'redemption_amount': amount,
+        }).action_redeem_cashback()
@@ -0,0 +1,36 @@
+from odoo.tests import tagged
+
+from .common import CashbackCommon
+
+
+@tagged('post_install', '-at_install')
+class TestCashbackBackfill(CashbackCommon):
+
+    def test_legacy_awards_not_repeated(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('cashback.enabled', False)
+        live = self._post_invoice(self.partner_a)
+        archived = self._post_invoice(self.partner_a)
+        fresh = self._post_invoice(self.partner_a)
+        ICP.set_param('cashback.enabled', True)
+
+        # Awarded before the ledger existed: only a transaction is left, maybe archived
+        self.env['cashback.transaction'].create({
+            'partner_id': self.partner_a.id,
+            'invoice_id': live.id,
+            'cashback_amount': 50.0,
+            'status': 'settled',
+        })
+        self.env['cashback.transaction.archive'].create({
+            'partner_id': self.partner_a.id,
+            'invoice_id': archived.id,
+            'cashback_amount': 50.0,
+            'status': 'settled',
+        })
+
+        (live + archived + fresh)._process_cashback_on_invoice()
+
+        earned = self.env['cashback.ledger'].search([
+            ('partner_id', '=', self.partner_a.id), ('entry_type', '=', 'earn'),
+        ])
+        self.assertEqual(earned.invoice_id, fresh)
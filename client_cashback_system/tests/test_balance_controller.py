@@ -0,0 +1,48 @@
+from odoo import Command
+from odoo.tests import HttpCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCashbackBalanceController(HttpCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.customer = cls.env['res.partner'].create({'name': 'Cashback Customer', 'ref': 'CB001'})
+        for login, group in (('cashback_portal', 'base.group_portal'), ('cashback_internal', 'base.group_user')):
+            cls.env['res.users'].create({
+                'name': login,
+                'login': login,
+                'password': login,
+                'groups_id': [Command.set([cls.env.ref(group).id])],
+            })
+
+    def test_portal_user_refused(self):
+        self.authenticate('cashback_portal', 'cashback_portal')
+        response = self.url_open(f'/cashback/balances?ids={self.customer.id}')
+        self.assertEqual(response.status_code, 403)
+
+    def test_internal_user(self):
+        self.authenticate('cashback_internal', 'cashback_internal')
+        response = self.url_open(f'/cashback/balances?ids={self.customer.id}&refs=CB001')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([partner['id'] for partner in response.json()['partners']], [self.customer.id])
+
+        # Unchanged partners revalidate with the ETag
+        response = self.url_open(
+            f'/cashback/balances?ids={self.customer.id}&refs=CB001',
+            headers={'If-None-Match': response.headers['ETag']},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_partner_leaving_result(self):
+        self.authenticate('cashback_internal', 'cashback_internal')
+        url = '/cashback/balances?refs=CB001'
+        etag = self.url_open(url).headers['ETag']
+
+        # The partner no longer matches the reference, the cached answer is stale
+        self.customer.ref = 'CB002'
+        response = self.url_open(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['partners'], [])
+        self.assertNotIn('Last-Modified', response.headers)
@@ -0,0 +1,139 @@
+from odoo.tests import tagged
+from odoo.tools import config
+
+from .common import CashbackCommon
+
+from datetime import timedelta
+from unittest.mock import patch
+import json
+import os
+import tempfile
+
+# Queries a batch may run on top of the single-record budget
+QUERY_SLACK = 5
+
+
+@tagged('cashback_perf', 'post_install', '-at_install')
+class TestCashbackPerf(CashbackCommon):
+    """Query budgets of the cashback batch operations.
+
+    Every operation is measured on one record first; running it on a large
+    batch must then fit in the same budget. The timings are written to the
+    ``cashback_perf_log`` file (a temporary one by default).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env['ir.config_parameter'].sudo().set_param('cashback.notification_mode', 'batched')
+        cls.perf_log = config.get('cashback_perf_log') or os.path.join(tempfile.gettempdir(), 'cashback_perf.jsonl')
+        cls.startClassPatcher(patch.dict(config.options, {'cashback_perf_log': cls.perf_log}))
+        cls.customers = cls.env['res.partner'].create([{'name': f'Cashback Customer {i}'} for i in range(50)])
+
+    def _count_queries(self, func):
+        self.env.flush_all()
+        self.env.invalidate_all()
+        queries = self.env.cr.sql_log_count
+        func()
+        self.env.flush_all()
+        return self.env.cr.sql_log_count - queries
+
+    def assertBatchQueries(self, operation, single, batch, size):
+        """Run ``batch`` within the query budget of ``single``, and check its timing record"""
+        budget = self._count_queries(single)
+        self.env.invalidate_all()
+        with self.assertQueryCount(budget + QUERY_SLACK):
+            batch()
+
+        with open(self.perf_log) as log_file:
+            record = json.loads(log_file.readlines()[-1])
+        self.assertEqual(record['operation'], operation)
+        self.assertEqual(record['size'], size)
+
+    def test_invoice_award(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('cashback.enabled', False)
+        invoices = self.env['account.move'].union(*(
+            self._post_invoice(self.customers[i % len(self.customers)]) for i in range(101)
+        ))
+        ICP.set_param('cashback.enabled', True)
+
+        # The award is the cashback part of action_post
+        self.assertBatchQueries(
+            'invoice_award',
+            lambda: invoices[:1]._process_cashback_on_invoice(),
+            lambda: invoices[1:]._process_cashback_on_invoice(),
+            100,
+        )
+        self.assertEqual(len(self.env['cashback.ledger'].search([('invoice_id', 'in', invoices.ids)])), 101)
+
+    def test_settlement_chunk(self):
+        self.env['cashback.ledger'].create([{
+            'partner_id': partner.id,
+            'entry_type': 'earn',
+            'amount': 10.0,
+        } for partner in self.customers])
+
+        self.assertBatchQueries(
+            'month_settlement',
+            lambda: self.customers[:1]._settle_month_cashback(self.period_start),
+            lambda: self.customers[1:]._settle_month_cashback(self.period_start),
+            49,
+        )
+        self.assertEqual(set(self.customers.mapped('cashback_balans')), {10.0})
+
+    def test_redemption_wizard(self):
+        first, second = self.customers[:2]
+        for partner, history in ((first, 1), (second, 30)):
+            self._seed_balance(partner, 100.0)
+            self.env['cashback.redemption'].create([{
+                'partner_id': partner.id,
+                'redemption_amount': 1.0,
+                'redemption_date': self.today - timedelta(days=400 + day),
+            } for day in range(history)])
+        first_order, second_order = self._create_order(first), self._create_order(second)
+
+        # Opening and redeeming does not depend on the redemption history
+        self.assertBatchQueries(
+            'redeem',
+            lambda: self._redeem(first_order, 10.0),
+            lambda: self._redeem(second_order, 10.0),
+            1,
+        )
+        self.assertAlmostEqual(second.cashback_balans, 90.0)
+
+    def test_settings_save(self):
+        self.customers.last_redemption_date = self.today
+
+        def save(redeem_days):
+            settings = self.env['res.config.settings'].create({})
+            settings.cashback_redeem_days = redeem_days
+            settings.set_values()
+
+        self.assertBatchQueries('settings_save', lambda: save(60), lambda: save(30), 1)
+        self.assertEqual(set(self.customers.mapped('next_redeem_date')), {self.today + timedelta(days=30)})
+
+    def test_order_cancel(self):
+        self._seed_balance(self.partner_a, 1000.0)
+        orders = self.env['sale.order'].union(*(self._create_order(self.partner_a) for _i in range(21)))
+        product = self.env.ref('client_cashback_system.product_cashback')
+        self.env['sale.order.line'].create([{
+            'order_id': order.id,
+            'product_id': product.id,
+            'price_unit': -10.0,
+            'is_cashback_line': True,
+        } for order in orders])
+        self.env['cashback.redemption'].create([{
+            'partner_id': self.partner_a.id,
+            'redemption_amount': 10.0,
+            'sale_order_id': order.id,
+        } for order in orders])
+
+        # The refund is the cashback part of cancelling the orders
+        self.assertBatchQueries(
+            'order_cancel_refund',
+            lambda: orders[:1]._refund_cashback(),
+            lambda: orders[1:]._refund_cashback(),
+            20,
+        )
+        self.assertAlmostEqual(self.partner_a.cashback_balans, 1210.0)
@@ -0,0 +1,112 @@
+from odoo import api, SUPERUSER_ID
+from odoo.exceptions import ValidationError
+from odoo.modules.registry import Registry
+from odoo.tests import BaseCase, get_db_name, tagged
+
+from collections import Counter
+from psycopg2.extensions import TransactionRollbackError
+import random
+import threading
+import time
+
+# Concurrent transactions, and operations run by each of them
+WORKERS = 8
+ROUNDS = 15
+# Retries of an operation that failed on a serialization failure
+MAX_RETRIES = 10
+
+SEED_BALANCE = 100.0
+EARN_AMOUNT = 1.0
+REDEEM_AMOUNT = 5.0
+
+
+@tagged('post_install', '-at_install')
+class TestCashbackConcurrency(BaseCase):
+    """Earns and redemptions of one customer from concurrent, really committed transactions"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.registry = Registry(get_db_name())
+        with cls.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            partner = env['res.partner'].create({'name': 'Cashback Stress Customer'})
+            env['cashback.ledger'].create([{
+                'partner_id': partner.id,
+                'entry_type': entry_type,
+                'amount': SEED_BALANCE,
+            } for entry_type in ('earn', 'settle')])
+            cls.partner_id = partner.id
+        cls.addClassCleanup(cls._delete_partner)
+
+    @classmethod
+    def _delete_partner(cls):
+        # The ledger refuses unlink(), its entries go with the partner
+        with cls.registry.cursor() as cr:
+            cr.execute("DELETE FROM res_partner WHERE id = %s", [cls.partner_id])
+
+    def _earn(self, env):
+        partner = env['res.partner'].browse(self.partner_id)
+        # The snapshot is taken long before the balance changes, like in a request
+        partner.cashback_balans
+        time.sleep(random.uniform(0, 0.02))
+        env['cashback.ledger'].create({'partner_id': partner.id, 'entry_type': 'earn', 'amount': EARN_AMOUNT})
+
+    def _redeem(self, env):
+        partner = env['res.partner'].browse(self.partner_id)
+        partner.cashback_balans
+        time.sleep(random.uniform(0, 0.02))
+        partner._cashback_lock()
+        if partner.cashback_balans < REDEEM_AMOUNT:
+            raise ValidationError('Insufficient cashback balance')
+        env['cashback.ledger'].create({'partner_id': partner.id, 'entry_type': 'redeem', 'amount': REDEEM_AMOUNT})
+
+    def _run(self, operation, outcomes):
+        for _attempt in range(MAX_RETRIES):
+            with self.registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                try:
+                    getattr(self, f'_{operation}')(env)
+                    cr.commit()
+                except TransactionRollbackError:
+                    cr.rollback()
+                    outcomes[operation, 'serialization'] += 1
+                    continue
+                except ValidationError:
+                    cr.rollback()
+                    outcomes[operation, 'refused'] += 1
+                    return
+            outcomes[operation, 'ok'] += 1
+            return
+        outcomes[operation, 'gave up'] += 1
+
+    def _worker(self, outcomes, errors):
+        try:
+            for _round in range(ROUNDS):
+                self._run(random.choice(['earn', 'earn', 'redeem']), outcomes)
+        except Exception as e:
+            errors.append(e)
+
+    def test_concurrent_earn_and_redeem(self):
+        outcomes, errors = Counter(), []
+        threads = [threading.Thread(target=self._worker, args=(outcomes, errors)) for _i in range(WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(errors)
+
+        # Earns never touch the partner row in a blocking way: they cannot conflict
+        self.assertEqual(outcomes['earn', 'serialization'], 0)
+        self.assertFalse(outcomes['redeem', 'gave up'])
+
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            partner = env['res.partner'].browse(self.partner_id)
+            self.assertFalse(env['cashback.ledger']._rebuild_partner_balances(partner.ids, repair=False))
+            partner._cashback_fold_pending()
+            self.assertFalse(env['cashback.balance.pending'].search([('partner_id', '=', partner.id)]))
+            self.assertAlmostEqual(partner.accumulated_cashback, outcomes['earn', 'ok'] * EARN_AMOUNT)
+            self.assertAlmostEqual(partner.cashback_balans, SEED_BALANCE - outcomes['redeem', 'ok'] * REDEEM_AMOUNT)
+            self.assertGreaterEqual(partner.cashback_balans, 0.0)
+            self.assertAlmostEqual(partner.cashback_lifetime_earned, SEED_BALANCE + outcomes['earn', 'ok'] * EARN_AMOUNT)
@@ -0,0 +1,106 @@
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import SQL
+
+from datetime import date
+
+
+@tagged('post_install', '-at_install')
+class TestCashbackIndexes(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Realistic shapes: few partners with accumulated cashback or an own
+        # percent, and mostly settled transactions
+        template = cls.env['res.partner'].create({'name': 'Cashback Index Partner'})
+        cls._seed(template, 20000)
+        cls._seed(template, 50, accumulated_cashback=SQL('10'))
+        cls._seed(template, 50, cashback_precent_custom=SQL('TRUE'), cashback_precent_override=SQL('7'))
+
+        cls.env.cr.execute("SELECT id FROM res_partner WHERE id > %s ORDER BY id LIMIT 200", [template.id])
+        cls.partner_ids = [row[0] for row in cls.env.cr.fetchall()]
+
+        transaction = cls.env['cashback.transaction'].create({
+            'partner_id': template.id,
+            'cashback_amount': 1.0,
+            'transaction_date': date(2025, 1, 1),
+            'status': 'settled',
+        })
+        cls._seed(
+            transaction, 20000,
+            partner_id=SQL('(%s::int[])[1 + mod(n, 200)]', cls.partner_ids),
+            transaction_date=SQL("DATE '2025-06-30' - mod(n, 700)"),
+            status=SQL("CASE WHEN mod(n, 40) = 0 THEN 'earned' ELSE 'settled' END"),
+        )
+
+        redemption = cls.env['cashback.redemption'].create({
+            'partner_id': template.id,
+            'redemption_amount': 1.0,
+            'redemption_date': date(2025, 1, 1),
+        })
+        cls._seed(
+            redemption, 20000,
+            partner_id=SQL('(%s::int[])[1 + mod(n, 200)]', cls.partner_ids),
+            redemption_date=SQL("DATE '2025-06-30' - mod(n, 700)"),
+        )
+
+    @classmethod
+    def _seed(cls, record, count, **values):
+        """Insert ``count`` copies of ``record`` in one statement, then analyze its table.
+
+        ``values`` override columns with SQL expressions, in which ``n`` is the copy number.
+        """
+        cls.env.flush_all()
+        table = record._table
+        cls.env.cr.execute("""
+            SELECT column_name
+              FROM information_schema.columns
+             WHERE table_schema = current_schema() AND table_name = %s AND column_name != 'id'
+        """, [table])
+        columns = [row[0] for row in cls.env.cr.fetchall()]
+        cls.env.cr.execute(SQL(
+            "INSERT INTO %s (%s) SELECT %s FROM %s t, generate_series(1, %s) n WHERE t.id = %s",
+            SQL.identifier(table),
+            SQL(', ').join(SQL.identifier(column) for column in columns),
+            SQL(', ').join(values[column] if column in values else SQL('t.%s', SQL.identifier(column)) for column in columns),
+            SQL.identifier(table), count, record.id,
+        ))
+        cls.env.cr.execute(SQL('ANALYZE %s', SQL.identifier(table)))
+
+    def assertUsesIndex(self, query, index):
+        self.env.cr.execute(SQL("EXPLAIN %s", query))
+        plan = '\n'.join(row[0] for row in self.env.cr.fetchall())
+        self.assertIn(index, plan, plan)
+
+    def test_settlement_queries(self):
+        Partner = self.env['res.partner']
+        self.assertUsesIndex(SQL(
+            "SELECT id FROM res_partner WHERE accumulated_cashback > 0 AND id > %s ORDER BY id", 0,
+        ), 'res_partner_accumulated_cashback_idx')
+        self.assertUsesIndex(Partner._search(
+            [('id', '>=', 1), ('accumulated_cashback', '>', 0), ('cashback_precent', '>', 0)], order='id',
+        ).select('id'), 'res_partner_accumulated_cashback_idx')
+        self.assertUsesIndex(self.env['cashback.transaction']._search([
+            ('partner_id', 'in', self.partner_ids[:3]),
+            ('status', '=', 'earned'),
+            ('transaction_date', '>=', date(2025, 1, 1)),
+        ]).select('id'), 'cashback_transaction_earned_partner_date_idx')
+
+    def test_last_redemption_query(self):
+        self.assertUsesIndex(SQL("""
+            SELECT partner_id, MAX(redemption_date)
+              FROM cashback_redemption
+             WHERE partner_id = ANY(%s)
+             GROUP BY partner_id
+        """, self.partner_ids[:3]), 'cashback_redemption_partner_date_idx')
+
+    def test_percent_queries(self):
+        Partner = self.env['res.partner'].with_context(active_test=False)
+        self.assertUsesIndex(
+            Partner._search([('cashback_precent_custom', '=', True)]).select('id'),
+            'res_partner_cashback_precent_override_idx',
+        )
+        self.assertUsesIndex(
+            Partner._search([('accumulated_cashback', '>', 0)]).select('id'),
+            'res_partner_accumulated_cashback_idx',
+        )
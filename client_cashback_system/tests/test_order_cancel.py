@@ -0,0 +1,41 @@
+from odoo.tests import tagged
+
+from .common import CashbackCommon
+
+
+@tagged('post_install', '-at_install')
+class TestCashbackOrderCancel(CashbackCommon):
+
+    def _refunds(self, order):
+        return self.env['cashback.ledger'].search([('sale_order_id', '=', order.id), ('entry_type', '=', 'refund')])
+
+    def test_cancel_twice_refunds_once(self):
+        self._seed_balance(self.partner_a, 100.0)
+        order = self._create_order(self.partner_a)
+        self._redeem(order, 40.0)
+        self.assertAlmostEqual(self.partner_a.cashback_balans, 60.0)
+
+        order._action_cancel()
+        order.action_draft()
+        order._action_cancel()
+
+        self.assertAlmostEqual(sum(self._refunds(order).mapped('amount')), 40.0)
+        self.assertAlmostEqual(self.partner_a.cashback_balans, 100.0)
+
+    def test_cancel_without_redemption_rows(self):
+        self._seed_balance(self.partner_a, 100.0)
+        order = self._create_order(self.partner_a)
+        # Redeemed before redemptions were recorded: only the order line is left
+        self.env['sale.order.line'].create({
+            'order_id': order.id,
+            'product_id': self.env.ref('client_cashback_system.product_cashback').id,
+            'price_unit': -30.0,
+            'is_cashback_line': True,
+        })
+
+        order._action_cancel()
+        order.action_draft()
+        order._action_cancel()
+
+        self.assertAlmostEqual(sum(self._refunds(order).mapped('amount')), 30.0)
+        self.assertAlmostEqual(self.partner_a.cashback_balans, 130.0)
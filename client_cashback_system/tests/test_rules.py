@@ -0,0 +1,66 @@
+from odoo import Command
+from odoo.tests import tagged
+
+from .common import CashbackCommon
+
+from datetime import timedelta
+
+
+@tagged('post_install', '-at_install')
+class TestCashbackRules(CashbackCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product_b.categ_id = cls.env['product.category'].create({'name': 'Cashback Promo'})
+        cls.rule = cls.env['cashback.rule'].create({
+            'name': 'Promo',
+            'percent': 10.0,
+            'product_categ_id': cls.product_b.categ_id.id,
+        })
+
+    def test_zero_base_invoice(self):
+        # Returned goods cancelling the base out, with different rates per category
+        invoice = self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_a.id,
+            'invoice_date': self.today,
+            'invoice_line_ids': [
+                Command.create({'product_id': self.product_a.id, 'price_unit': 100.0, 'quantity': -1, 'tax_ids': False}),
+                Command.create({'product_id': self.product_b.id, 'price_unit': 100.0, 'quantity': 1, 'tax_ids': False}),
+            ],
+        })
+        invoice.action_post()
+        self.assertFalse(self.env['cashback.transaction'].search([('invoice_id', '=', invoice.id)]))
+
+    def test_archive_keeps_rules(self):
+        transaction = self.env['cashback.transaction'].create({
+            'partner_id': self.partner_a.id,
+            'cashback_amount': 10.0,
+            'transaction_date': self.today - timedelta(days=400),
+            'status': 'settled',
+            'rule_ids': [Command.set(self.rule.ids)],
+        })
+
+        self.assertEqual(self.env['cashback.transaction']._archive_transactions(self.today, 100), 1)
+
+        archive = self.env['cashback.transaction.archive'].search([('original_id', '=', transaction.id)])
+        self.assertEqual(archive.rule_ids, self.rule)
+
+    def test_rules_follow_changes(self):
+        Transaction = self.env['cashback.transaction']
+        subcategory = self.env['product.category'].create({'name': 'Cashback Sub'})
+        self.product_a.categ_id = subcategory
+
+        def post_percent():
+            invoice = self.init_invoice(
+                'out_invoice', partner=self.partner_a, invoice_date=self.today, products=self.product_a, post=True
+            )
+            return Transaction.search([('invoice_id', '=', invoice.id)]).cashback_percent
+
+        self.assertEqual(post_percent(), 5.0)
+        # Moving the category under the promo category, after the rules were compiled
+        subcategory.parent_id = self.product_b.categ_id
+        self.assertEqual(post_percent(), 10.0)
+        self.rule.percent = 20.0
+        self.assertEqual(post_percent(), 20.0)
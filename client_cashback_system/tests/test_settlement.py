@@ -0,0 +1,82 @@
+from odoo import Command
+from odoo.tests import tagged
+
+from .common import CashbackCommon
+
+
+@tagged('post_install', '-at_install')
+class TestCashbackSettlement(CashbackCommon):
+
+    def test_settle_chunk(self):
+        invoice = self._post_invoice(self.partner_a)
+        self._pay(invoice)
+        earned = self.partner_a.accumulated_cashback
+        self.assertAlmostEqual(earned, invoice.amount_untaxed * 0.05)
+
+        self.partner_a._settle_month_cashback(self.period_start)
+
+        self.assertEqual(self.partner_a.accumulated_cashback, 0.0)
+        self.assertAlmostEqual(self.partner_a.cashback_balans, earned)
+        self.assertAlmostEqual(self.partner_a.cashback_lifetime_earned, earned)
+        settle = self.env['cashback.ledger'].search([
+            ('partner_id', '=', self.partner_a.id), ('entry_type', '=', 'settle'),
+        ])
+        self.assertAlmostEqual(settle.amount, earned)
+        self.assertFalse(self.env['cashback.ledger']._rebuild_partner_balances(self.partner_a.ids, repair=False))
+
+    def test_reset_chunk_with_debt(self):
+        invoice = self._post_invoice(self.partner_a)
+        earned = self.partner_a.accumulated_cashback
+
+        self.partner_a._settle_month_cashback(self.period_start)
+
+        self.assertEqual(self.partner_a.accumulated_cashback, 0.0)
+        self.assertEqual(self.partner_a.cashback_balans, 0.0)
+        self.assertAlmostEqual(self.partner_a.cashback_lifetime_reset, earned)
+        self.assertTrue(invoice.amount_residual)
+
+    def test_period_closed_once(self):
+        Slice = self.env['cashback.settlement.slice']
+        invoice = self._post_invoice(self.partner_a)
+        self._pay(invoice)
+        earned = self.partner_a.accumulated_cashback
+
+        self.partner_a.process_end_of_month_cashback()
+        slices = Slice.search([('period', '=', self.period_start)])
+        self.assertTrue(slices)
+        Slice._cron_settle_slices()
+        self.partner_a.process_end_of_month_cashback(start_period=False)
+
+        ICP = self.env['ir.config_parameter'].sudo()
+        self.assertFalse(ICP.get_param('cashback.settlement_period'))
+        self.assertEqual(ICP.get_param('cashback.settlement_closed_period'), str(self.period_start))
+        self.assertAlmostEqual(self.partner_a.cashback_balans, earned)
+
+        # Follow-up checks and a repeated monthly run leave the closed period alone
+        self.partner_a.process_end_of_month_cashback(start_period=False)
+        self.partner_a.process_end_of_month_cashback()
+        self.assertEqual(Slice.search([]), slices)
+        self.assertFalse(ICP.get_param('cashback.settlement_period'))
+
+    def test_debt_on_contact_counts_for_company(self):
+        contact = self.env['res.partner'].create({'name': 'Accounting', 'parent_id': self.partner_a.id})
+        entry = self.env['account.move'].create({
+            'move_type': 'entry',
+            'date': self.today,
+            'line_ids': [
+                Command.create({
+                    'account_id': self.company_data['default_account_receivable'].id,
+                    'partner_id': contact.id,
+                    'debit': 300.0,
+                }),
+                Command.create({
+                    'account_id': self.company_data['default_account_revenue'].id,
+                    'credit': 300.0,
+                }),
+            ],
+        })
+        entry.action_post()
+
+        debts = (self.partner_a | contact)._get_partners_debt()
+        self.assertAlmostEqual(debts[self.partner_a.id], 300.0)
+        self.assertAlmostEqual(debts[contact.id], 300.0)
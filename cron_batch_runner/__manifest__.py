@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+{
+    'name': "Cron Batch Runner",
+
+    'summary': "Chunked, committed and self re-triggering cron jobs shared by the custom modules",
+
+    'description': """
+Runs a batch job chunk by chunk, committing after every chunk and handing the
+rest over to a later cron run once its time budget is spent.
+    """,
+
+    'author': "Abdullabek",
+    'website': "https://www.yourcompany.com",
+
+    'category': 'Customization',
+    'version': '0.1',
+
+    'depends': ['base'],
+
+    'data': [],
+    'application': False,
+    'installable': True,
+    'license':'LGPL-3'
+}
@@ -0,0 +1,39 @@
+from odoo import models, api
+
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Seconds a batch job may work in one cron run before re-triggering itself
+BATCH_TIME_LIMIT = 60
+
+
+class IrCron(models.Model):
+    _inherit = 'ir.cron'
+
+    @api.model
+    def _commit_batch(self):
+        """Commit the current chunk of a batch job (skipped while running tests)"""
+        if not getattr(threading.current_thread(), 'testing', False):
+            self.env.cr.commit()
+
+    @api.model
+    def _run_batches(self, process_batch, crons, time_limit=BATCH_TIME_LIMIT):
+        """Call ``process_batch()`` and commit, chunk after chunk, until it returns a falsy value.
+
+        Once ``time_limit`` seconds are spent the ``crons`` are triggered to go
+        on in a later run, so a single run never holds a cron worker for long.
+        Returns whether the job is finished.
+        """
+        deadline = time.monotonic() + time_limit
+        while True:
+            processed = process_batch()
+            self._commit_batch()
+            if not processed:
+                return True
+            if time.monotonic() > deadline:
+                for cron in crons:
+                    cron._trigger()
+                return False
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+{
+    'name': "Currency Conversion Cache",
+
+    'summary': "Transaction-scoped conversion rate cache shared by the custom modules",
+
+    'description': """
+Memoizes currency conversion rates for the current transaction and converts
+whole lists of amounts per currency pair in one call.
+    """,
+
+    'author': "Abdullabek",
+    'website': "https://www.yourcompany.com",
+
+    'category': 'Customization',
+    'version': '0.1',
+
+    'depends': ['base'],
+
+    'data': [],
+    'application': False,
+    'installable': True,
+    'license':'LGPL-3'
+}
@@ -0,0 +1,40 @@
+from odoo import models, fields, api
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Key of the rate cache in cr.cache
+RATE_CACHE_KEY = 'currency_conversion_cache.rates'
+
+
+class ResCurrency(models.Model):
+    _inherit = 'res.currency'
+
+    @api.model
+    def _get_cached_conversion_rate(self, from_currency, to_currency, company, date):
+        """Conversion rate, looked up once per (from, to, company, date) in the current transaction"""
+        if from_currency == to_currency:
+            return 1.0
+
+        cr = self.env.cr
+        rates = cr.cache.get(RATE_CACHE_KEY)
+        if rates is None:
+            rates = cr.cache[RATE_CACHE_KEY] = {}
+            # Dropping the cache when the transaction ends, rates may change afterwards
+            cr.postcommit.add(lambda: cr.cache.pop(RATE_CACHE_KEY, None))
+            cr.postrollback.add(lambda: cr.cache.pop(RATE_CACHE_KEY, None))
+
+        date = fields.Date.to_date(date) or fields.Date.context_today(self)
+        key = (from_currency.id, to_currency.id, company.id, date)
+        if key not in rates:
+            rates[key] = self._get_conversion_rate(from_currency, to_currency, company, date)
+        return rates[key]
+
+    def _convert_amounts(self, amounts, to_currency, company, date, round=True):
+        """Convert a list of amounts from this currency with a single rate lookup"""
+        self.ensure_one()
+        rate = self._get_cached_conversion_rate(self, to_currency, company, date)
+        if round:
+            return [to_currency.round(amount * rate) for amount in amounts]
+        return [amount * rate for amount in amounts]
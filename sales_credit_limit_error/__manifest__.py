@@ -10,9 +10,13 @@ Long description of module's purpose
     'author': "Abdullabek",
     'website': "https://www.yourcompany.com",
     'category': 'Custom',
-    'version': '0.1',
-    'depends': ['base', 'sale_management'],
-    'data': [],
+    'version': '0.2',
+    'depends': ['base', 'sale_management', 'currency_conversion_cache', 'cron_batch_runner'],
+    'data': [
+        'security/ir.model.access.csv',
+        'data/credit_exposure_cron.xml',
+        'views/credit_exposure.xml',
+    ],
     'application': True,
     'license': 'LGPL-3',
 
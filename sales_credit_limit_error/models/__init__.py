@@ -1 +1,3 @@
 from . import models
+from . import credit_exposure
+from . import credit_exposure_queue
\ No newline at end of file
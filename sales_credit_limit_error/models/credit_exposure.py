@@ -0,0 +1,254 @@
+from odoo import models, fields, api
+
+from collections import defaultdict
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Partners recomputed (and committed) per chunk of a full rebuild or of the refresh queue
+REBUILD_BATCH_SIZE = 2000
+# Key of the partners changed by the current transaction in cr.precommit.data
+DIRTY_PARTNERS_KEY = 'sale.credit.exposure.dirty'
+# Last partner rebuilt, in ir.config_parameter while a full rebuild runs
+REBUILD_PROGRESS_KEY = 'sale_credit_exposure.rebuild_last_partner_id'
+
+
+class SaleCreditExposure(models.Model):
+	"""Per-company credit exposure of a customer.
+
+	Transactions changing the exposure only queue the customer, the rows are
+	written by the refresh cron. Credit checks compute queued customers on the
+	fly, so they never wait for the cron.
+	"""
+	_name = 'sale.credit.exposure'
+	_description = 'Customer Credit Exposure'
+	_rec_name = 'partner_id'
+
+	partner_id = fields.Many2one('res.partner', string='Customer', required=True, index=True, ondelete='cascade')
+	company_id = fields.Many2one('res.company', string='Company', required=True, ondelete='cascade')
+	currency_id = fields.Many2one(related='company_id.currency_id', string='Currency')
+
+	# Posted, not yet reconciled receivable
+	receivable_amount = fields.Monetary(string='Receivable', readonly=True)
+	# Confirmed orders that are not fully invoiced yet
+	order_amount = fields.Monetary(string='Uninvoiced Orders', readonly=True)
+	exposure_amount = fields.Monetary(string='Exposure', readonly=True)
+
+	_sql_constraints = [
+		('partner_company_uniq', 'unique(partner_id, company_id)', 'Credit exposure must be unique per customer and company!'),
+	]
+
+	@api.model
+	def _mark_dirty(self, partners):
+		"""Queue the customers for the refresh cron when the transaction commits"""
+		partner_ids = set(partners.commercial_partner_id.ids)
+		if not partner_ids:
+			return
+		dirty = self.env.cr.precommit.data.get(DIRTY_PARTNERS_KEY)
+		if dirty is None:
+			dirty = self.env.cr.precommit.data[DIRTY_PARTNERS_KEY] = set()
+			self.env.cr.precommit.add(self._queue_dirty)
+		dirty.update(partner_ids)
+
+	@api.model
+	def _queue_dirty(self):
+		"""Insert the customers changed by this transaction into the refresh queue.
+
+		Only inserts, so concurrent postings of the same customer never update
+		(or wait on) its exposure rows.
+		"""
+		dirty = self.env.cr.precommit.data.pop(DIRTY_PARTNERS_KEY, None)
+		if not dirty:
+			return
+		self.env.cr.execute("""
+			INSERT INTO sale_credit_exposure_queue (partner_id) SELECT unnest(%s::int[])
+		""", [sorted(dirty)])
+		self.env.ref('sales_credit_limit_error.ir_cron_credit_exposure_refresh').sudo()._trigger()
+		self.env['ir.cron.trigger'].flush_model()
+
+	@api.model
+	def _cron_refresh(self):
+		"""Recompute the exposure of the queued customers, in committed chunks"""
+		def refresh_batch():
+			# Entries queued after this snapshot stay for the next chunk
+			self.env.cr.execute("""
+				DELETE FROM sale_credit_exposure_queue
+				 WHERE id IN (SELECT id FROM sale_credit_exposure_queue ORDER BY id LIMIT %s)
+				RETURNING partner_id
+			""", [REBUILD_BATCH_SIZE])
+			partner_ids = {row[0] for row in self.env.cr.fetchall()}
+			if partner_ids:
+				self.env['sale.credit.exposure.queue'].invalidate_model()
+				self._refresh(self.env['res.partner'].browse(partner_ids).exists())
+			return len(partner_ids)
+
+		self.env['ir.cron']._run_batches(refresh_batch, self.env.ref('sales_credit_limit_error.ir_cron_credit_exposure_refresh'))
+
+	@api.model
+	def _compute_exposures(self, partners):
+		"""Return ``{(partner_id, company_id): (receivable, orders)}`` of the given customers"""
+		exposures = defaultdict(lambda: [0.0, 0.0])
+
+		for partner, company, residual in self.env['account.move.line'].sudo()._read_group(
+			[
+				('partner_id', 'in', partners.ids),
+				('account_id.account_type', '=', 'asset_receivable'),
+				('parent_state', '=', 'posted'),
+				('reconciled', '=', False),
+			],
+			['partner_id', 'company_id'],
+			['amount_residual:sum'],
+		):
+			exposures[(partner.id, company.id)][0] += residual
+
+		# Part of the orders not invoiced yet, converted with the rate stored on
+		# the order: the invoiced part is already in the receivable
+		orders = self.env['sale.order'].sudo().search([
+			('state', '=', 'sale'),
+			('invoice_status', '!=', 'invoiced'),
+			('partner_id.commercial_partner_id', 'in', partners.ids),
+		])
+		for order in orders:
+			key = (order.partner_id.commercial_partner_id.id, order.company_id.id)
+			exposures[key][1] += order.amount_to_invoice / (order.currency_rate or 1.0)
+
+		return exposures
+
+	@api.model
+	def _refresh(self, partners):
+		"""Recompute the exposure rows of the given customers.
+
+		Rows are upserted, so a refresh never fails on a row created
+		concurrently. Customers without anything left keep their rows, at zero.
+		"""
+		partners = partners.commercial_partner_id
+		if not partners:
+			return
+		exposures = self._compute_exposures(partners)
+
+		self.flush_model()
+		self.env.cr.execute("SELECT partner_id, company_id FROM sale_credit_exposure WHERE partner_id = ANY(%s)", [partners.ids])
+		for key in self.env.cr.fetchall():
+			exposures.setdefault(key, (0.0, 0.0))
+		if not exposures:
+			return
+
+		keys = list(exposures)
+		self.env.cr.execute("""
+			INSERT INTO sale_credit_exposure (partner_id, company_id, receivable_amount, order_amount, exposure_amount,
+			                                  create_uid, create_date, write_uid, write_date)
+			SELECT v.partner_id, v.company_id, v.receivable, v.orders, v.receivable + v.orders,
+			       %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+			  FROM unnest(%(partner_ids)s::int[], %(company_ids)s::int[], %(receivables)s::numeric[], %(orders)s::numeric[])
+			       AS v(partner_id, company_id, receivable, orders)
+			ON CONFLICT (partner_id, company_id) DO UPDATE
+			   SET receivable_amount = EXCLUDED.receivable_amount,
+			       order_amount = EXCLUDED.order_amount,
+			       exposure_amount = EXCLUDED.exposure_amount,
+			       write_uid = EXCLUDED.write_uid,
+			       write_date = EXCLUDED.write_date
+		""", {
+			'uid': self.env.uid,
+			'partner_ids': [partner_id for partner_id, _company_id in keys],
+			'company_ids': [company_id for _partner_id, company_id in keys],
+			'receivables': [exposures[key][0] for key in keys],
+			'orders': [exposures[key][1] for key in keys],
+		})
+		self.invalidate_model()
+
+	@api.model
+	def _get_exposure(self, partners, company):
+		"""Return the current exposure per customer in the company.
+
+		Customers changed in this transaction, still queued or without a row
+		are computed on the fly, the others read from their row. Nothing is
+		written here.
+		"""
+		Exposure = self.sudo()
+		exposure = dict.fromkeys(partners.ids, 0.0)
+		rows = Exposure.search([('partner_id', 'in', partners.ids), ('company_id', '=', company.id)])
+		for row in rows:
+			exposure[row.partner_id.id] = row.exposure_amount
+
+		stale_ids = set(self.env.cr.precommit.data.get(DIRTY_PARTNERS_KEY, ()))
+		stale_ids.update(self.env['sale.credit.exposure.queue'].sudo().search([('partner_id', 'in', partners.ids)]).partner_id.ids)
+		stale = partners.filtered(lambda partner: partner.id in stale_ids) | (partners - rows.partner_id)
+		if stale:
+			for partner in stale:
+				exposure[partner.id] = 0.0
+			for (partner_id, company_id), amounts in Exposure._compute_exposures(stale).items():
+				if company_id == company.id:
+					exposure[partner_id] = sum(amounts)
+		return exposure
+
+	@api.model
+	def _get_commercial_partners_after(self, last_id):
+		"""Return the next chunk of commercial partners (companies and contacts without a parent)"""
+		return self.env['res.partner'].with_context(active_test=False).search([
+			('id', '>', last_id),
+			'|', ('is_company', '=', True), ('parent_id', '=', False),
+		], order='id', limit=REBUILD_BATCH_SIZE)
+
+	@api.model
+	def action_rebuild_all(self):
+		"""Recompute every customer's exposure from scratch, in the background"""
+		self.env['ir.config_parameter'].sudo().set_param(REBUILD_PROGRESS_KEY, 0)
+		self.env.ref('sales_credit_limit_error.ir_cron_credit_exposure_rebuild').sudo()._trigger()
+
+	@api.model
+	def _cron_rebuild(self):
+		"""Go on with the full rebuild started by ``action_rebuild_all``, in committed chunks.
+
+		The last rebuilt partner is committed with every chunk, so the job
+		resumes where it stopped.
+		"""
+		ICP = self.env['ir.config_parameter'].sudo()
+		last_id = ICP.get_param(REBUILD_PROGRESS_KEY)
+		if not last_id:
+			return
+		last_id = int(last_id)
+
+		def rebuild_batch():
+			nonlocal last_id
+			partners = self._get_commercial_partners_after(last_id)
+			if not partners:
+				ICP.set_param(REBUILD_PROGRESS_KEY, False)
+				_logger.info('Credit exposure rebuild finished')
+				return 0
+			self._refresh(partners)
+			last_id = partners[-1].id
+			ICP.set_param(REBUILD_PROGRESS_KEY, last_id)
+			return len(partners)
+
+		self.env['ir.cron']._run_batches(rebuild_batch, self.env.ref('sales_credit_limit_error.ir_cron_credit_exposure_rebuild'))
+
+	@api.model
+	def _verify_all(self):
+		"""Compare every stored exposure with a fresh computation, without writing.
+
+		Mismatching rows are logged and their number is returned. Queued
+		customers are skipped, their rows are about to be refreshed.
+		"""
+		queued = set(self.env['sale.credit.exposure.queue'].search([]).partner_id.ids)
+		mismatches = 0
+		last_id = 0
+		while True:
+			partners = self._get_commercial_partners_after(last_id)
+			if not partners:
+				break
+			last_id = partners[-1].id
+			partners = partners.filtered(lambda partner: partner.id not in queued)
+			exposures = self._compute_exposures(partners)
+			stored = {
+				(row.partner_id.id, row.company_id.id): row.exposure_amount
+				for row in self.search([('partner_id', 'in', partners.ids)])
+			}
+			for key in set(exposures) | set(stored):
+				expected = sum(exposures.get(key, (0.0, 0.0)))
+				if round(expected - stored.get(key, 0.0), 2):
+					mismatches += 1
+					_logger.warning('Credit exposure mismatch for partner %s, company %s: stored %s, expected %s',
+						key[0], key[1], stored.get(key, 0.0), expected)
+
+		_logger.info('Credit exposure verification done, %d mismatches', mismatches)
+		return mismatches
@@ -0,0 +1,11 @@
+from odoo import models, fields
+
+
+class SaleCreditExposureQueue(models.Model):
+	"""Customers whose credit exposure changed, waiting for the refresh cron"""
+	_name = 'sale.credit.exposure.queue'
+	_description = 'Credit Exposure Refresh Queue'
+	_order = 'id'
+	_log_access = False
+
+	partner_id = fields.Many2one('res.partner', string='Customer', required=True, index=True, ondelete='cascade')
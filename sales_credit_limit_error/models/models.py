@@ -1,45 +1,137 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+from collections import defaultdict
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Order line fields changing the amount of a confirmed order
+EXPOSURE_LINE_FIELDS = {'product_uom_qty', 'price_unit', 'discount', 'tax_id'}
+
 
 class SaleOrder(models.Model):
 	_inherit = 'sale.order'
 
 
 	def action_confirm(self):
-		for order in self:
-			partner = order.partner_id
-
-			# Customer Credit Amount
-			total_due = partner.credit
-
-			# Customer credit limit
-			credit_limit = partner.credit_limit
-
-			amount_company_currency = order.currency_id._convert(
-				order.amount_total,
-                order.company_id.currency_id,
-                order.company_id,
-                order.date_order or fields.Date.today()
-			)
+		self._check_credit_limit()
+		result = super(SaleOrder, self).action_confirm()
+		self.env['sale.credit.exposure']._mark_dirty(self.partner_id)
+		return result
+
+	def _action_cancel(self):
+		result = super(SaleOrder, self)._action_cancel()
+		self.env['sale.credit.exposure']._mark_dirty(self.partner_id)
+		return result
+
+	def _check_credit_limit(self):
+		"""Check the whole batch against the credit limit of each customer"""
+		# The credit limit is company dependent: reading it in each order's company
+		orders = self.filtered(lambda o: o.partner_id.commercial_partner_id.with_company(o.company_id).credit_limit)
+		if not orders:
+			return
+		partners = orders.partner_id.commercial_partner_id
+
+		# Converting the batch to the companies main currency, one vector
+		# conversion per (currency, company, date)
+		to_convert = defaultdict(lambda: self.env['sale.order'])
+		for order in orders:
+			order_date = (order.date_order or fields.Datetime.now()).date()
+			to_convert[(order.currency_id, order.company_id, order_date)] |= order
+		amounts_company_currency = {}
+		for (currency, company, order_date), group in to_convert.items():
+			amounts = currency._convert_amounts(group.mapped('amount_total'), company.currency_id, company, order_date)
+			amounts_company_currency.update(zip(group.ids, amounts))
+
+		# Summing up the batch per customer and company
+		batch_amounts = defaultdict(float)
+		currencies = {}
+		for order in orders:
+			partner = order.partner_id.commercial_partner_id
+			amount_company_currency = amounts_company_currency[order.id]
 
 			_logger.info(f"Amount converted to the companies main currecy: {order.amount_total} Main Currency: {order.company_id}--> {amount_company_currency}")
 
-
-			new_total_due = total_due + amount_company_currency
-
-			if credit_limit and new_total_due > credit_limit:
-				raise UserError(_(
+			batch_amounts[(partner, order.company_id)] += amount_company_currency
+			currencies[partner] = order.company_id.currency_id
+
+		# Customer Credit Amount: indexed lookup of the maintained exposure
+		total_due = {}
+		Exposure = self.env['sale.credit.exposure']
+		for company in orders.company_id:
+			company_partners = partners.filtered(lambda p: (p, company) in batch_amounts)
+			for partner_id, exposure in Exposure._get_exposure(company_partners, company).items():
+				total_due[(partner_id, company.id)] = exposure
+
+		errors = []
+		for (partner, company), batch_amount in batch_amounts.items():
+			new_total_due = total_due[(partner.id, company.id)] + batch_amount
+			credit_limit = partner.with_company(company).credit_limit
+			if new_total_due > credit_limit:
+				errors.append(_(
 					"Hurmatli foydalanuvchi siz ushbu mijozga %s, o’z qarz limiti %.2f %s dan ortiq sotuv yarata olmaysiz!"
 				) % (
 					partner.name,
-					credit_limit, order.company_id.currency_id.name		
+					credit_limit, currencies[partner].name
 				))
-		return super(SaleOrder, self).action_confirm()
+
+		if errors:
+			raise UserError("\n".join(errors))
+
+
+class SaleOrderLine(models.Model):
+	_inherit = 'sale.order.line'
+
+
+	@api.model_create_multi
+	def create(self, vals_list):
+		lines = super(SaleOrderLine, self).create(vals_list)
+		lines._mark_credit_exposure_dirty()
+		return lines
+
+	def write(self, vals):
+		result = super(SaleOrderLine, self).write(vals)
+		if EXPOSURE_LINE_FIELDS.intersection(vals):
+			self._mark_credit_exposure_dirty()
+		return result
+
+	def unlink(self):
+		self._mark_credit_exposure_dirty()
+		return super(SaleOrderLine, self).unlink()
+
+	def _mark_credit_exposure_dirty(self):
+		"""Queue the customers of the confirmed orders among these lines"""
+		confirmed = self.filtered(lambda line: line.order_id.state == 'sale')
+		self.env['sale.credit.exposure']._mark_dirty(confirmed.order_id.partner_id)
+
+
+class AccountMove(models.Model):
+	_inherit = 'account.move'
+
+
+	def _post(self, soft=True):
+		posted = super(AccountMove, self)._post(soft)
+		self.env['sale.credit.exposure']._mark_dirty(posted.partner_id)
+		return posted
+
+	def button_draft(self):
+		self.env['sale.credit.exposure']._mark_dirty(self.partner_id)
+		return super(AccountMove, self).button_draft()
+
+	def button_cancel(self):
+		self.env['sale.credit.exposure']._mark_dirty(self.partner_id)
+		return super(AccountMove, self).button_cancel()
+
+
+class AccountMoveLine(models.Model):
+	_inherit = 'account.move.line'
 
 
+	def reconcile(self):
+		self.env['sale.credit.exposure']._mark_dirty(self.partner_id)
+		return super(AccountMoveLine, self).reconcile()
 
+	def remove_move_reconcile(self):
+		self.env['sale.credit.exposure']._mark_dirty(self.partner_id)
+		return super(AccountMoveLine, self).remove_move_reconcile()
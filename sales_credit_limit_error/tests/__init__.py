@@ -0,0 +1 @@
+from . import test_credit_limit
\ No newline at end of file
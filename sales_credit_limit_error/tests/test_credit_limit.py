@@ -0,0 +1,106 @@
+from odoo import Command
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCreditLimit(AccountTestInvoicingCommon):
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.company_2 = cls.setup_other_company()['company']
+
+	@classmethod
+	def _create_order(cls, partner, company, amount):
+		return cls.env['sale.order'].with_company(company).create({
+			'partner_id': partner.id,
+			'company_id': company.id,
+			'order_line': [Command.create({'product_id': cls.product_a.id, 'price_unit': amount, 'tax_id': False})],
+		})
+
+	def _run_refresh_cron(self):
+		# Queueing happens right before commit, which tests never reach
+		self.env.cr.precommit.run()
+		self.env['sale.credit.exposure']._cron_refresh()
+
+	def _exposure_row(self, partner):
+		return self.env['sale.credit.exposure'].search([
+			('partner_id', '=', partner.id), ('company_id', '=', self.env.company.id),
+		])
+
+	def test_limit_of_order_company(self):
+		# Limit only set in the second company, checked while working in the first one
+		self.partner_a.with_company(self.company_2).credit_limit = 500.0
+		order = self._create_order(self.partner_a, self.company_2, 1000.0)
+		with self.assertRaises(UserError):
+			order.action_confirm()
+
+		order = self._create_order(self.partner_a, self.env.company, 1000.0)
+		order.action_confirm()
+		self.assertEqual(order.state, 'sale')
+
+	def test_partially_invoiced_order(self):
+		order = self._create_order(self.partner_a, self.env.company, 1000.0)
+		order.action_confirm()
+		invoice = order._create_invoices()
+		invoice.invoice_line_ids.quantity = 0.5
+		invoice.action_post()
+
+		exposure = self.env['sale.credit.exposure']._get_exposure(self.partner_a, self.env.company)
+		self.assertAlmostEqual(exposure[self.partner_a.id], 1000.0)
+		self._run_refresh_cron()
+		row = self._exposure_row(self.partner_a)
+		self.assertAlmostEqual(row.receivable_amount, 500.0)
+		self.assertAlmostEqual(row.order_amount, 500.0)
+
+	def test_order_line_change(self):
+		Exposure = self.env['sale.credit.exposure']
+		order = self._create_order(self.partner_a, self.env.company, 1000.0)
+		order.action_confirm()
+		self._run_refresh_cron()
+		self.assertAlmostEqual(self._exposure_row(self.partner_a).exposure_amount, 1000.0)
+		self.assertFalse(self.env['sale.credit.exposure.queue'].search([]))
+
+		# The stored row is stale until the cron runs, the check computes the customer on the fly
+		order.order_line.price_unit = 1500.0
+		self.assertAlmostEqual(Exposure._get_exposure(self.partner_a, self.env.company)[self.partner_a.id], 1500.0)
+		self._run_refresh_cron()
+		self.assertAlmostEqual(self._exposure_row(self.partner_a).exposure_amount, 1500.0)
+
+	def test_rebuild_in_cron(self):
+		Exposure = self.env['sale.credit.exposure']
+		order = self._create_order(self.partner_a, self.env.company, 1000.0)
+		order.action_confirm()
+		Exposure.action_rebuild_all()
+		self.assertFalse(self._exposure_row(self.partner_a))
+
+		Exposure._cron_rebuild()
+		self.assertAlmostEqual(self._exposure_row(self.partner_a).exposure_amount, 1000.0)
+		self.assertFalse(Exposure._verify_all())
+
+
+@tagged('cashback_perf', 'post_install', '-at_install')
+class TestCreditLimitPerf(AccountTestInvoicingCommon):
+
+	def test_confirm_batch_queries(self):
+		partners = self.env['res.partner'].create([
+			{'name': f'Credit Customer {i}', 'credit_limit': 100000.0} for i in range(21)
+		])
+		orders = self.env['sale.order'].create([{
+			'partner_id': partner.id,
+			'order_line': [Command.create({'product_id': self.product_a.id, 'price_unit': 100.0, 'tax_id': False})],
+		} for partner in partners])
+
+		# The check is the credit limit part of action_confirm
+		self.env.flush_all()
+		self.env.invalidate_all()
+		queries = self.env.cr.sql_log_count
+		orders[:1]._check_credit_limit()
+		self.env.flush_all()
+		budget = self.env.cr.sql_log_count - queries
+
+		self.env.invalidate_all()
+		with self.assertQueryCount(budget + 5):
+			orders[1:]._check_credit_limit()